@@ -0,0 +1,55 @@
+"""
+Время векторного расчета здоровья портов на синтетическом парке.
+
+python3 -m bench.health_scoring [кол-во портов]
+"""
+import sys
+import time
+
+import numpy as np
+
+from core.health import rank, to_matrix, IN_ERR, OUT_ERR, CRC
+from core.records import PortCounters
+
+
+def make_fleet(n, seed=1):
+    rng = np.random.default_rng(seed)
+    rates = rng.integers(0, 100_000_000, size=(n, 2))
+    errors = rng.poisson(0.2, size=(n, 3)) * (rng.random((n, 1)) < 0.05) * 1000
+    return [
+        PortCounters(
+            host=f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}",
+            port=str(i % 48 + 1),
+            state="UP",
+            speed="1G",
+            in_rate=int(rates[i, 0]),
+            out_rate=int(rates[i, 1]),
+            in_errors=int(errors[i, 0]),
+            out_errors=int(errors[i, 1]),
+            crc=int(errors[i, 2]),
+        )
+        for i in range(n)
+    ]
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    fleet = make_fleet(n)
+
+    started = time.perf_counter()
+    keys, matrix = to_matrix(fleet)
+    built = time.perf_counter()
+    errors = matrix[:, IN_ERR] + matrix[:, OUT_ERR] + matrix[:, CRC]
+    previous = (keys, errors * 0.9, time.time() - 3600)
+
+    started_rank = time.perf_counter()
+    rows = rank(fleet, previous, top=20)
+    elapsed = (time.perf_counter() - started_rank) * 1000
+    print(f"портов: {n}")
+    print(f"матрица из PortCounters : {(built - started) * 1000:.1f} ms")
+    print(f"матрица + расчет + top  : {elapsed:.1f} ms")
+    print(f"худший: {rows[0].host} {rows[0].port} score={rows[0].score:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Сравнение памяти: списки dict (как раньше в парсерах) против MacEntry
+и колоночной MacTable.
+
+python3 -m bench.records_memory [кол-во записей]
+"""
+import sys
+import tracemalloc
+from core.records import MacEntry, MacTable, format_mac, mac_to_int
+
+
+def make_rows(n):
+    for i in range(n):
+        yield (
+            format_mac(0x001A2B000000 + i),
+            str(1 + i % 4000),
+            f"gei_1/{1 + i % 48}",
+            "dynamic",
+        )
+
+
+def measure(build, n):
+    tracemalloc.start()
+    data = build(n)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del data
+    return size
+
+
+def as_dicts(n):
+    return [
+        {"mac": mac, "vlan": vlan, "port": port, "type": type_}
+        for mac, vlan, port, type_ in make_rows(n)
+    ]
+
+
+def as_records(n):
+    ports = {}
+    return [
+        MacEntry(mac_to_int(mac), int(vlan),
+                 ports.setdefault(port, port), "dynamic")
+        for mac, vlan, port, type_ in make_rows(n)
+    ]
+
+
+def as_table(n):
+    return MacTable(as_records(n))
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    print(f"записей: {n}")
+    base = None
+    for name, build in (("dict", as_dicts), ("MacEntry", as_records), ("MacTable", as_table)):
+        size = measure(build, n)
+        base = base or size
+        print(f"{name:<10}: {size / 1024 / 1024:8.2f} MB  ({size / n:6.1f} B/запись, x{base / size:.1f})")
+
+
+if __name__ == "__main__":
+    main()
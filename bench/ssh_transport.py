@@ -0,0 +1,177 @@
+"""
+Проверка SSH-транспорта на локальном SSH-сервере (paramiko в том же процессе):
+параллельные сессии к одному хосту идут каналами одного авторизованного
+соединения, неподошедшие учетные данные пропускаются, отказ всех - LoginError,
+ключ неизвестного коммутатора отклоняется.
+
+python3 -m bench.ssh_transport [кол-во сессий]
+"""
+import asyncio
+import os
+import re
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import paramiko
+
+from core.ssh_transport import SSHTransport
+from core.telnet_common import LoginError, read_until
+
+GOOD = ("admin", "good")
+BAD = ("admin", "bad")
+PROMPT = "Switch#"
+OUTPUT_END = re.compile(r"Switch#\s*$")
+
+
+# ================== FAKE SWITCH ==================
+class FakeSwitch(paramiko.ServerInterface):
+    def __init__(self, stats):
+        self.stats = stats
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        if (username, password) == GOOD:
+            self.stats["logins"] += 1
+            return paramiko.AUTH_SUCCESSFUL
+        self.stats["rejected"] += 1
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_pty_request(self, *args):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        self.stats["channels"] += 1
+        threading.Thread(target=shell, args=(channel,), daemon=True).start()
+        return True
+
+
+def shell(channel):
+    """CLI коммутатора: эхо команды, одна строка вывода, приглашение"""
+    channel.send(f"\r\n{PROMPT} ")
+    line = b""
+    while True:
+        data = channel.recv(1024)
+        if not data:
+            return
+        line += data
+        while b"\r" in line:
+            command, _, line = line.partition(b"\r")
+            command = command.decode().strip()
+            channel.send(f"{command}\r\noutput of {command}\r\n{PROMPT} ")
+
+
+def serve(sock, key, stats):
+    while True:
+        try:
+            conn, _ = sock.accept()
+        except OSError:
+            return
+        stats["connections"] += 1
+        server = paramiko.Transport(conn)
+        server.add_server_key(key)
+        server.start_server(server=FakeSwitch(stats))
+
+
+def start_server():
+    stats = {"connections": 0, "logins": 0, "rejected": 0, "channels": 0}
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(16)
+    key = paramiko.RSAKey.generate(2048)
+    threading.Thread(target=serve, args=(sock, key, stats), daemon=True).start()
+    return sock, stats
+
+
+# ================== CHECKS ==================
+async def run_command(ssh, host, credentials, command):
+    reader, writer = await ssh.open(host, credentials)
+    try:
+        writer.write(command + "\n")
+        _, text = await read_until(reader, (OUTPUT_END,), 5.0)
+        return text
+    finally:
+        writer.close()
+
+
+async def check(sessions):
+    sock, stats = start_server()
+    host, port = sock.getsockname()
+    known_hosts = os.path.join(tempfile.mkdtemp(), "known_hosts")
+    try:
+        # ключ не известен - соединение отклоняется до авторизации
+        strict = SSHTransport(port=port, host_keys=known_hosts)
+        try:
+            await run_command(strict, host, (GOOD,), "show version")
+        except paramiko.SSHException as e:
+            print(f"неизвестный ключ: {e}")
+        else:
+            raise AssertionError("ожидался отказ по ключу")
+        finally:
+            strict.close()
+        assert stats["logins"] == 0, stats
+        stats["connections"] = 0
+    except BaseException:
+        sock.close()
+        raise
+
+    # первый вход запоминает ключ, дальше он сверяется
+    ssh = SSHTransport(port=port, host_keys=known_hosts, accept_new=True)
+    try:
+        # первая учетная запись отклоняется - транспорт переходит ко второй
+        credentials = (BAD, GOOD)
+        started = time.perf_counter()
+        outputs = await asyncio.gather(*(
+            run_command(ssh, host, credentials, f"show port {i}") for i in range(sessions)
+        ))
+        elapsed = (time.perf_counter() - started) * 1000
+        for i, text in enumerate(outputs):
+            assert f"output of show port {i}" in text, text
+
+        # повторные сессии - новые каналы старого соединения
+        await run_command(ssh, host, credentials, "show version")
+
+        # отклоненная попытка + одно рабочее соединение на все сессии
+        assert stats["connections"] == 2, stats
+        assert stats["logins"] == 1, stats
+        assert stats["rejected"] == 1, stats
+        assert stats["channels"] == sessions + 1, stats
+        print(f"сессий: {sessions + 1}, SSH-соединений: {stats['connections']}, "
+              f"авторизаций: {stats['logins']}, отказов: {stats['rejected']}")
+        print(f"{sessions} параллельных сессий: {elapsed:.1f} ms")
+
+        try:
+            await run_command(ssh, host, (BAD,), "show version")
+        except LoginError as e:
+            print(f"неверные учетные данные: {e}")
+        else:
+            raise AssertionError("ожидалась LoginError")
+
+        # сохраненный ключ принимается и без accept_new
+        known = SSHTransport(port=port, host_keys=known_hosts)
+        try:
+            assert "output of show clock" in await run_command(known, host, (GOOD,), "show clock")
+        finally:
+            known.close()
+    finally:
+        ssh.close()
+        sock.close()
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    asyncio.run(check(sessions))
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import asyncio
+import contextvars
+import re
+from contextlib import contextmanager
+
+# критические разделы (состояние линка, скорость) выполняются до этого
+# срока от начала диагностики, даже если общий бюджет уже израсходован
+# на подключение; резерв один на диагностику, а не на каждый раздел
+CRITICAL_MIN = 2.0
+
+MISSING = "⏱ Нет данных: истекло время диагностики"
+
+_current = contextvars.ContextVar("diag_budget", default=None)
+
+
+class BudgetExceeded(Exception):
+    """Время диагностики истекло, команда прервана"""
+
+
+class Budget:
+    """Общий срок одной диагностики и список разделов, не успевших выполниться"""
+
+    def __init__(self, seconds: float, critical_min=CRITICAL_MIN):
+        self.seconds = seconds
+        self.critical_min = critical_min
+        started = asyncio.get_running_loop().time()
+        self.deadline = started + seconds
+        self.critical_deadline = started + max(seconds, critical_min)
+        self.missing = []
+
+    def remaining(self) -> float:
+        return self.deadline - asyncio.get_running_loop().time()
+
+    @property
+    def partial(self) -> bool:
+        return bool(self.missing)
+
+
+def parse_budget(value: str) -> float:
+    """'5', '5s', '1.5s', '500ms', '1m' -> секунды"""
+    m = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*(ms|s|m)?\s*", value or "")
+    if not m:
+        raise ValueError(f"некорректный бюджет времени: {value!r}")
+    seconds = float(m.group(1))
+    unit = m.group(2) or "s"
+    return seconds / 1000 if unit == "ms" else seconds * 60 if unit == "m" else seconds
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def deadline(seconds):
+    """Задает бюджет для диагностики в текущей задаче; None - без ограничения"""
+    if seconds is None:
+        yield None
+        return
+    budget = Budget(seconds)
+    token = _current.set(budget)
+    try:
+        yield budget
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def section(name: str, critical=False, report=True):
+    """
+    Раздел отчета. Если время истекло, раздел помечается пропущенным
+    (report - сразу вывести отметку вместо данных), диагностика идет дальше.
+    Критический раздел может идти до critical_deadline - не дольше
+    max(seconds, critical_min) от начала диагностики в сумме по всем разделам.
+    """
+    budget = _current.get()
+    if budget is None:
+        yield
+        return
+
+    saved = budget.deadline
+    if critical:
+        budget.deadline = max(budget.deadline, budget.critical_deadline)
+    try:
+        yield
+    except BudgetExceeded:
+        if name not in budget.missing:
+            budget.missing.append(name)
+        if report:
+            print(f"\n===== {name} =====\n{MISSING}")
+    finally:
+        budget.deadline = saved
+
+
+# ================== TIMEOUTS ==================
+def clamp(timeout: float) -> float:
+    """Таймаут ожидания, урезанный до остатка бюджета"""
+    budget = _current.get()
+    if budget is None:
+        return timeout
+    left = budget.remaining()
+    if left <= 0:
+        raise BudgetExceeded
+    return min(timeout, left)
+
+
+async def read(reader, n, timeout, done=None):
+    """
+    reader.read с таймаутом, урезанным до остатка бюджета.
+    Обычный таймаут простоя - asyncio.TimeoutError (вывод закончился),
+    обрыв по бюджету - BudgetExceeded (вывод мог быть неполным).
+    done() -> True: прочитанное уже закончилось приглашением CLI, тогда
+    истекший бюджет - тоже обычный конец вывода, команда не теряется.
+    """
+    try:
+        wait = clamp(timeout)
+    except BudgetExceeded:
+        if done and done():
+            raise asyncio.TimeoutError
+        raise
+    try:
+        return await asyncio.wait_for(reader.read(n), timeout=wait)
+    except asyncio.TimeoutError:
+        if wait < timeout and not (done and done()):
+            raise BudgetExceeded
+        raise
+
+
+async def limit(awaitable):
+    """Ожидание (очередь планировщика, подключение) не дольше остатка бюджета"""
+    budget = _current.get()
+    if budget is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout=max(budget.remaining(), 0))
+    except asyncio.TimeoutError:
+        # таймаут изнутри (нет приглашения логина и т.п.) - не бюджет
+        if budget.remaining() > 0:
+            raise
+        raise BudgetExceeded
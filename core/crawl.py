@@ -0,0 +1,135 @@
+import asyncio
+import ipaddress
+from typing import NamedTuple, Optional
+
+from core.detect_vendor import detect_vendor
+from core.lldp import port_key
+from core.records import MacEntry, Neighbor
+from core.scheduler import priority, INTERACTIVE
+
+
+class Hop(NamedTuple):
+    host: str
+    vendor: str
+    entry: Optional[MacEntry]        # где MAC виден на этом коммутаторе
+    neighbor: Optional[Neighbor]     # сосед за этим портом (None - порт доступа)
+
+
+class CrawlResult(NamedTuple):
+    path: list                       # цепочка Hop от стартового коммутатора
+    found: bool                      # MAC найден на порту доступа
+    visited: int
+    errors: dict                     # host -> текст ошибки
+
+
+def allowed_addresses(networks=(), hosts=()):
+    """
+    Проверка адреса соседа: подсети управления и хосты инвентаря.
+    Адрес из LLDP сообщает сам сосед - без проверки поддельный сосед
+    получил бы попытки входа со всеми учетными данными.
+    """
+    networks = [ipaddress.ip_network(n, strict=False) for n in networks]
+    hosts = set(hosts)
+
+    def allowed(address: str) -> bool:
+        if address in hosts:
+            return True
+        try:
+            ip = ipaddress.ip_address(address)
+        except ValueError:
+            return False
+        return any(ip in net for net in networks)
+
+    return allowed
+
+
+async def crawl(start, mac, password, modules, max_depth=8, parallel=8, vendors=None,
+                allowed=None):
+    """
+    Поиск порта доступа, за которым находится MAC, обходом в ширину по LLDP.
+    Соседи опрашиваются параллельно (не больше parallel), как только
+    становятся известны. Если MAC виден на аплинке - дальше идем только
+    к соседу за этим аплинком; если не виден - раскрываем всех соседей,
+    пока след MAC не найден. Первый порт доступа завершает обход,
+    остальные опросы отменяются.
+    modules - {вендор: модуль с crawl_info}, vendors - кэш host -> вендор.
+    allowed(address) - можно ли опрашивать соседа (см. allowed_addresses);
+    без него опрашивается только стартовый коммутатор. Отклоненные адреса
+    попадают в errors.
+    """
+    vendors = vendors if vendors is not None else {}
+    allowed = allowed or allowed_addresses()
+    limit = asyncio.Semaphore(parallel)
+    visited = {start}
+    skipped = set()
+    errors = {}
+    # лучший частичный путь: самый длинный, где MAC еще виден
+    best = []
+
+    async def visit(host, path):
+        try:
+            async with limit:
+                vendor = vendors.get(host)
+                if vendor is None:
+                    vendor = vendors[host] = await detect_vendor(host, password)
+                module = modules.get(vendor)
+                if module is None:
+                    raise LookupError(f"не поддерживается ({vendor})")
+                entry, neighbors = await module.crawl_info(host, password, mac)
+            return host, path, vendor, entry, neighbors, None
+        except Exception as e:
+            return host, path, None, None, [], str(e) or type(e).__name__
+
+    pending = set()
+
+    def spawn(host, path):
+        if len(path) < max_depth:
+            pending.add(asyncio.create_task(visit(host, path)))
+
+    def follow(address, path):
+        if not address or address in visited or address in skipped:
+            return
+        if not allowed(address):
+            skipped.add(address)
+            errors[address] = "вне разрешенных подсетей и инвентаря, не опрашивается"
+            return
+        visited.add(address)
+        spawn(address, path)
+
+    with priority(INTERACTIVE):
+        spawn(start, [])
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    pending.discard(task)
+                    host, path, vendor, entry, neighbors, error = task.result()
+                    if error:
+                        errors[host] = error
+                        continue
+
+                    if entry is None:
+                        # MAC здесь не виден: расширяемся, пока нет следа MAC
+                        if best:
+                            continue
+                        for n in neighbors:
+                            follow(n.address, path + [Hop(host, vendor, None, n)])
+                        continue
+
+                    uplink = next(
+                        (n for n in neighbors if port_key(n.local_port) == port_key(entry.port)),
+                        None,
+                    )
+                    hop = Hop(host, vendor, entry, uplink)
+                    if uplink is None:
+                        return CrawlResult(path + [hop], True, len(visited), errors)
+
+                    if len(path) + 1 > len(best):
+                        best = path + [hop]
+                    # сосед за аплинком опрашивается сразу, не дожидаясь уровня
+                    follow(uplink.address, path + [hop])
+        finally:
+            for task in pending:
+                task.cancel()
+
+    return CrawlResult(best, False, len(visited), errors)
@@ -0,0 +1,89 @@
+import os
+import re
+
+DEFAULT_USERNAME = "admin"
+ENV_VAR = "SWITCH_CREDENTIALS"
+
+
+def normalize_credentials(value):
+    """
+    Пароль-строка или список пар (логин, пароль) -> кортеж пар.
+    Кортеж хешируемый и годится как ключ кэша/пула сессий.
+    """
+    if isinstance(value, str):
+        return ((DEFAULT_USERNAME, value),)
+    return tuple(
+        (DEFAULT_USERNAME, item) if isinstance(item, str) else (item[0], item[1])
+        for item in value
+    )
+
+
+def _split_escaped(text: str, sep: str, maxsplit=-1):
+    """Делит по sep, кроме экранированного \\sep; экранирование остается"""
+    parts = [""]
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if ch == "\\" and i + 1 < len(text):
+            parts[-1] += text[i:i + 2]
+            i += 2
+            continue
+        if ch == sep and maxsplit != 0:
+            parts.append("")
+            maxsplit -= 1
+        else:
+            parts[-1] += ch
+        i += 1
+    return parts
+
+
+def _unescape(text: str) -> str:
+    return re.sub(r"\\(.)", r"\1", text)
+
+
+def parse_credentials(text: str):
+    """
+    Файл учетных данных: по записи на строку, 'логин:пароль' или 'пароль'.
+    Логин отделяется первым ':', в пароле допустимы любые символы;
+    пароль с ':' без логина записывается как 'admin:па:роль'.
+    """
+    creds = []
+    for line in text.splitlines():
+        item = line.strip()
+        if not item or item.startswith("#"):
+            continue
+        user, sep, password = item.partition(":")
+        creds.append((user, password) if sep else (DEFAULT_USERNAME, item))
+    return tuple(creds)
+
+
+def parse_env_credentials(text: str):
+    """
+    SWITCH_CREDENTIALS: записи 'логин:пароль' через запятую (или перевод строки);
+    запятая, двоеточие и обратная косая черта в значениях экранируются: \\, \\: \\\\
+    """
+    creds = []
+    for line in text.splitlines():
+        for item in _split_escaped(line.strip(), ","):
+            item = item.strip()
+            if not item:
+                continue
+            parts = _split_escaped(item, ":", maxsplit=1)
+            if len(parts) == 2:
+                creds.append((_unescape(parts[0]), _unescape(parts[1])))
+            else:
+                creds.append((DEFAULT_USERNAME, _unescape(item)))
+    return tuple(creds)
+
+
+def load_credentials(path=None):
+    """Файл --credentials, иначе переменная SWITCH_CREDENTIALS"""
+    if path:
+        with open(path, encoding="utf-8") as f:
+            creds = parse_credentials(f.read())
+    else:
+        creds = parse_env_credentials(os.environ.get(ENV_VAR, ""))
+
+    if not creds:
+        raise ValueError("не заданы учетные данные")
+    return creds
@@ -0,0 +1,69 @@
+import re
+
+# ================== CAPABILITIES ==================
+# фильтры вывода на стороне коммутатора по вендорам:
+# фильтр -> шаблон команды ({command} - исходная команда, {pattern} - образец)
+CAPABILITIES = {
+    "ZTE": {
+        "include": "{command} | include {pattern}",
+        "begin": "{command} | begin {pattern}",
+    },
+    "ELTEX": {
+        "include": "{command} | include {pattern}",
+        "begin": "{command} | begin {pattern}",
+    },
+    "SNR": {
+        "include": "{command} | include {pattern}",
+        "begin": "{command} | begin {pattern}",
+    },
+    # DES/DGS: в CLI нет конвейеров, фильтруем на клиенте
+    "D-LINK": {},
+}
+
+# ответ прошивки, которая не знает фильтр (ищется в начале вывода)
+REJECTED = re.compile(
+    r"%\s*(invalid|unrecognized|unknown|incomplete|ambiguous)"
+    r"|invalid input|unrecognized command|command not found|bad command"
+    r"|^\s*\^\s*$",
+    re.I | re.M,
+)
+
+# (host, фильтр), которые прошивка не приняла
+_unsupported = set()
+
+
+def supports(host: str, vendor: str, name: str) -> bool:
+    return name in CAPABILITIES.get(vendor, {}) and (host, name) not in _unsupported
+
+
+def apply(host: str, vendor: str, command: str, include=None, begin=None):
+    """
+    Команда с фильтром на стороне коммутатора, если он поддерживается.
+    Возвращает (команда, имя фильтра или None).
+    """
+    for name, pattern in (("include", include), ("begin", begin)):
+        if pattern and supports(host, vendor, name):
+            template = CAPABILITIES[vendor][name]
+            return template.format(command=command, pattern=pattern), name
+    return command, None
+
+
+def rejected(output: str) -> bool:
+    head = "\n".join(output.splitlines()[:4])
+    return bool(REJECTED.search(head))
+
+
+async def fetch(fetch_output, host, vendor, command, include=None, begin=None, stop=None):
+    """
+    Выполняет команду с фильтром на коммутаторе. Если прошивка фильтр
+    не приняла, он запоминается как неподдерживаемый для хоста и команда
+    повторяется без фильтра - вывод разбирается на клиенте как обычно.
+    fetch_output(command, stop) -> вывод.
+    """
+    filtered, name = apply(host, vendor, command, include, begin)
+    output = await fetch_output(filtered, stop)
+    if name is None or not rejected(output):
+        return output
+
+    _unsupported.add((host, name))
+    return await fetch_output(command, stop)
@@ -0,0 +1,188 @@
+import os
+import time
+from itertools import chain
+from typing import NamedTuple
+
+import numpy as np
+
+from core.paths import data_path
+from core.records import PortCounters
+
+# столбцы матрицы счетчиков, одна строка - один порт
+COLUMNS = ("in_rate", "out_rate", "in_errors", "out_errors", "crc")
+IN_RATE, OUT_RATE, IN_ERR, OUT_ERR, CRC = range(len(COLUMNS))
+
+# средний кадр ~1500 байт: бит/с -> кадров/с
+BITS_PER_FRAME = 1500 * 8
+
+
+class PortHealth(NamedTuple):
+    host: str
+    port: str
+    state: str
+    errors: int         # сумма счетчиков ошибок
+    delta: int          # прирост с прошлого обхода (-1 - нет данных)
+    error_rate: float   # ошибок/с (nan - порта не было в прошлом обходе)
+    error_ratio: float  # ошибок на кадр трафика (nan - аналогично)
+    score: float
+
+
+# ================== MATRIX ==================
+def to_matrix(counters):
+    """list[PortCounters] -> (ключи 'host port', матрица n x len(COLUMNS))"""
+    keys = np.array([c.host + " " + c.port for c in counters], dtype=str)
+    # поля PortCounters с in_rate по crc идут подряд - берем срез кортежа
+    first = PortCounters._fields.index(COLUMNS[0])
+    fields = slice(first, first + len(COLUMNS))
+    matrix = np.fromiter(
+        chain.from_iterable(c[fields] for c in counters),
+        dtype=np.float64,
+        count=len(counters) * len(COLUMNS),
+    ).reshape(len(counters), len(COLUMNS))
+    return keys, matrix
+
+
+# нижняя граница разброса (в log1p-единицах): если почти все порты чистые,
+# MAD равен нулю и любая единичная ошибка дала бы бесконечный score
+MIN_SPREAD = 0.5
+
+
+def robust_z(values):
+    """Отклонение от медианы парка в единицах MAD"""
+    median = np.median(values)
+    mad = np.median(np.abs(values - median)) * 1.4826
+    return (values - median) / max(mad, MIN_SPREAD)
+
+
+# ================== SCORING ==================
+def _score(errors, rate, frames, crc):
+    """score группы портов: rate сравнивается с медианой этой же группы"""
+    ratio = rate / (frames + 1.0)
+    score = (
+        np.clip(robust_z(np.log1p(rate)), 0, None)
+        + np.clip(robust_z(np.log1p(ratio * 1e6)), 0, None)
+        + crc / (errors + 1.0)
+    )
+    # без ошибок порт не может быть проблемным, как бы ни отличался от медианы
+    return np.where(errors > 0, score, 0.0)
+
+
+def score_ports(keys, matrix, previous=None, now=None):
+    """
+    Векторный расчет здоровья портов.
+    previous - (keys, errors, timestamp) прошлого обхода или None.
+    Возвращает (errors, delta, error_rate, error_ratio, score).
+
+    Скорость есть только у портов из прошлого обхода, у остальных
+    error_rate и error_ratio - nan. В первом обходе порты сравниваются
+    по накопленным счетчикам; если прошлый обход есть, у новых портов
+    от score остается только доля CRC: ошибки за все время работы порта
+    нельзя ставить в один ряд с ошибками в секунду.
+    """
+    now = time.time() if now is None else now
+    errors = matrix[:, IN_ERR] + matrix[:, OUT_ERR] + matrix[:, CRC]
+    frames = (matrix[:, IN_RATE] + matrix[:, OUT_RATE]) / BITS_PER_FRAME
+    crc = matrix[:, CRC]
+
+    delta = np.full(len(keys), -1.0)
+    error_rate = np.full(len(keys), np.nan)
+    error_ratio = np.full(len(keys), np.nan)
+    score = np.zeros(len(keys))
+    matched = np.zeros(len(keys), dtype=bool)
+    has_previous = previous is not None and len(previous[0]) > 0
+    if has_previous and len(keys):
+        prev_keys, prev_errors, prev_ts = previous
+        elapsed = max(now - prev_ts, 1.0)
+        order = np.argsort(prev_keys)
+        sorted_keys = prev_keys[order]
+        pos = np.searchsorted(sorted_keys, keys).clip(max=len(order) - 1)
+        matched = sorted_keys[pos] == keys
+        prev = prev_errors[order][pos]
+        # счетчик сбросили - весь текущий счетчик считается приростом
+        grown = np.where(errors >= prev, errors - prev, errors)
+        delta = np.where(matched, grown, -1.0)
+        error_rate[matched] = grown[matched] / elapsed
+        error_ratio[matched] = error_rate[matched] / (frames[matched] + 1.0)
+        score[matched] = _score(errors[matched], error_rate[matched], frames[matched], crc[matched])
+
+    fresh = ~matched
+    if not has_previous:
+        score = _score(errors, errors, frames, crc)
+    elif fresh.any():
+        score[fresh] = np.where(errors[fresh] > 0, crc[fresh] / (errors[fresh] + 1.0), 0.0)
+    return errors, delta, error_rate, error_ratio, score
+
+
+def rank(counters, previous=None, top=20, now=None):
+    """Худшие top портов по score"""
+    if not counters:
+        return []
+    keys, matrix = to_matrix(counters)
+    # несобранные счетчики - не нули: в медиану парка и прирост не входят
+    known = np.fromiter((c.complete for c in counters), dtype=bool, count=len(counters))
+    errors, score = np.zeros(len(counters)), np.zeros(len(counters))
+    rate, ratio = np.full(len(counters), np.nan), np.full(len(counters), np.nan)
+    delta = np.full(len(counters), -1.0)
+    if known.any():
+        scored = score_ports(keys[known], matrix[known], previous, now)
+        for column, values in zip((errors, delta, rate, ratio, score), scored):
+            column[known] = values
+
+    top = min(top, len(score))
+    idx = np.argpartition(-score, top - 1)[:top]
+    idx = idx[np.argsort(-score[idx], kind="stable")]
+    return [
+        PortHealth(
+            host=counters[i].host,
+            port=counters[i].port,
+            state=counters[i].state,
+            errors=int(errors[i]),
+            delta=int(delta[i]),
+            error_rate=float(rate[i]),
+            error_ratio=float(ratio[i]),
+            score=float(score[i]),
+        )
+        for i in idx
+    ]
+
+
+# ================== SNAPSHOTS ==================
+def snapshot_path():
+    return data_path("health_snapshot.npz")
+
+
+def load_snapshot(path=None):
+    path = path or snapshot_path()
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as data:
+        return data["keys"], data["errors"], float(data["timestamp"])
+
+
+def save_snapshot(counters, path=None, now=None):
+    """Снимок ошибок для прироста в следующем обходе; порты без счетчиков не входят"""
+    path = path or snapshot_path()
+    keys, matrix = to_matrix([c for c in counters if c.complete])
+    errors = matrix[:, IN_ERR] + matrix[:, OUT_ERR] + matrix[:, CRC]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.savez(
+        path,
+        keys=keys,
+        errors=errors,
+        timestamp=np.float64(time.time() if now is None else now),
+    )
+
+
+def format_ranking(rows):
+    lines = ["===== WORST PORTS =====",
+             f"{'HOST':<16}{'PORT':<10}{'STATE':<7}{'ERRORS':>10}{'DELTA':>9}{'ERR/S':>10}{'ERR/FRAME':>12}{'SCORE':>8}"]
+    for r in rows:
+        delta = str(r.delta) if r.delta >= 0 else "-"
+        # без прошлого замера скорости нет - накопленный счетчик не выводится как ERR/S
+        rate = f"{r.error_rate:.2f}" if not np.isnan(r.error_rate) else "-"
+        ratio = f"{r.error_ratio:.2e}" if not np.isnan(r.error_ratio) else "-"
+        lines.append(
+            f"{r.host:<16}{r.port:<10}{r.state:<7}{r.errors:>10}{delta:>9}"
+            f"{rate:>10}{ratio:>12}{r.score:>8.2f}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,183 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from core.paths import data_path
+from core.records import stack_port
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+    ts REAL NOT NULL, host TEXT NOT NULL, port TEXT NOT NULL,
+    state TEXT, speed TEXT,
+    in_rate INTEGER, out_rate INTEGER,
+    in_errors INTEGER, out_errors INTEGER, crc INTEGER
+);
+CREATE INDEX IF NOT EXISTS counters_host_port_ts ON counters (host, port, ts);
+CREATE INDEX IF NOT EXISTS counters_ts ON counters (ts);
+
+CREATE TABLE IF NOT EXISTS macs (
+    ts REAL NOT NULL, host TEXT NOT NULL, port TEXT NOT NULL,
+    vlan INTEGER, mac INTEGER
+);
+CREATE INDEX IF NOT EXISTS macs_host_port_ts ON macs (host, port, ts);
+CREATE INDEX IF NOT EXISTS macs_mac ON macs (mac);
+
+CREATE TABLE IF NOT EXISTS log_events (
+    ts REAL NOT NULL, host TEXT NOT NULL, port TEXT NOT NULL,
+    log_id INTEGER, timestamp TEXT, state TEXT, text TEXT
+);
+CREATE INDEX IF NOT EXISTS log_events_host_port_ts ON log_events (host, port, ts);
+"""
+
+INSERTS = {
+    "counters": "INSERT INTO counters VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+    "macs": "INSERT INTO macs VALUES (?, ?, ?, ?, ?)",
+    "log_events": "INSERT INTO log_events VALUES (?, ?, ?, ?, ?, ?, ?)",
+}
+
+
+def default_path():
+    return data_path("history.sqlite")
+
+
+def connect(path=None):
+    path = path or default_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+# ================== WRITER ==================
+class HistoryWriter:
+    """
+    Запись истории в фоновом потоке: event loop только кладет строки
+    в очередь, поток пишет их пачками в одной транзакции.
+    """
+
+    def __init__(self, path=None, batch_size=500, flush_interval=1.0):
+        self.path = path or default_path()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, table: str, rows):
+        if rows:
+            self._queue.put((table, rows))
+
+    def _run(self):
+        conn = connect(self.path)
+        pending = {}
+        count = 0
+        deadline = time.monotonic() + self.flush_interval
+        stopping = False
+
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0.01))
+            except queue.Empty:
+                item = ()
+            if item is None:
+                stopping = True
+            elif item:
+                table, rows = item
+                pending.setdefault(table, []).extend(rows)
+                count += len(rows)
+
+            if count and (stopping or count >= self.batch_size or time.monotonic() >= deadline):
+                with conn:
+                    for table, rows in pending.items():
+                        conn.executemany(INSERTS[table], rows)
+                pending.clear()
+                count = 0
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+
+        conn.close()
+
+    def close(self):
+        """Дописывает очередь и останавливает поток"""
+        self._queue.put(None)
+        self._thread.join()
+
+
+_writer = None
+
+
+def enable(path=None, **kwargs) -> HistoryWriter:
+    global _writer
+    _writer = HistoryWriter(path, **kwargs)
+    return _writer
+
+
+def close():
+    global _writer
+    if _writer is not None:
+        _writer.close()
+        _writer = None
+
+
+# ================== RECORDING ==================
+def record_counters(counters):
+    if _writer is not None and counters is not None and counters.complete:
+        c = counters
+        _writer.put("counters", [(
+            time.time(), c.host, str(c.port), c.state, c.speed,
+            c.in_rate, c.out_rate, c.in_errors, c.out_errors, c.crc,
+        )])
+
+
+def record_macs(host, port, entries):
+    if _writer is not None:
+        now = time.time()
+        _writer.put("macs", [(now, host, str(port), e.vlan, e.mac) for e in entries])
+
+
+def record_log_events(host, events):
+    if _writer is not None:
+        now = time.time()
+        _writer.put("log_events", [
+            (now, host, e.port, e.log_id, e.timestamp, e.state, e.text) for e in events
+        ])
+
+
+# ================== QUERIES ==================
+def port_history(conn, host, port, since):
+    """Замеры порта; '2' находит и '1/0/2', под которым его записывают SNR и Eltex"""
+    return conn.execute(
+        "SELECT ts, state, speed, in_errors, out_errors, crc, in_rate, out_rate "
+        "FROM counters WHERE host = ? AND port IN (?, ?) AND ts >= ? ORDER BY ts",
+        (host, str(port), stack_port(port), since),
+    ).fetchall()
+
+
+def top_error_growth(conn, since, top=20):
+    """Порты с наибольшим приростом ошибок между первым и последним замером"""
+    return conn.execute(
+        """
+        WITH w AS (
+            SELECT host, port, ts, crc, in_errors + out_errors + crc AS errs
+            FROM counters WHERE ts >= ?
+        ),
+        span AS (
+            SELECT host, port, MIN(ts) AS t0, MAX(ts) AS t1, COUNT(*) AS samples
+            FROM w GROUP BY host, port HAVING samples >= 2
+        )
+        SELECT span.host, span.port, span.samples,
+               last.errs - first.errs AS growth,
+               last.crc - first.crc AS crc_growth,
+               span.t0, span.t1
+        FROM span
+        JOIN w AS first ON first.host = span.host AND first.port = span.port AND first.ts = span.t0
+        JOIN w AS last ON last.host = span.host AND last.port = span.port AND last.ts = span.t1
+        WHERE last.errs > first.errs
+        ORDER BY growth DESC
+        LIMIT ?
+        """,
+        (since, top),
+    ).fetchall()
@@ -0,0 +1,16 @@
+def parse_inventory(text: str):
+    """Строки 'IP PORT [PORT ...]', комментарии через #"""
+    targets = []
+    for line in text.splitlines():
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        host, *ports = line.replace(",", " ").split()
+        for port in ports:
+            targets.append((host, port))
+    return targets
+
+
+def load_inventory(path: str):
+    with open(path, encoding="utf-8") as f:
+        return parse_inventory(f.read())
@@ -0,0 +1,49 @@
+import re
+
+from core.records import Neighbor
+
+SYSTEM_NAME = re.compile(r"System\s*Name\s*:\s*(\S+)", re.I)
+MGMT_ADDRESS = re.compile(r"(?:Management\s*)?Address(?:es)?\s*:?\s*(\d{1,3}(?:\.\d{1,3}){3})", re.I)
+
+
+def parse_lldp_detail(raw, local_port):
+    """
+    Подробный вывод LLDP из блоков 'ключ : значение'. Новый сосед
+    начинается со строки, совпавшей с local_port (группа 1 - локальный порт).
+    """
+    neighbors = []
+    current = None
+    for line in raw.splitlines():
+        m = local_port.search(line)
+        if m:
+            if current:
+                neighbors.append(Neighbor(**current))
+            current = {"local_port": m.group(1), "address": "", "name": ""}
+            continue
+        if current is None:
+            continue
+        m = SYSTEM_NAME.search(line)
+        if m and not current["name"]:
+            current["name"] = m.group(1)
+        m = MGMT_ADDRESS.search(line)
+        if m and not current["address"]:
+            current["address"] = m.group(1)
+    if current:
+        neighbors.append(Neighbor(**current))
+    return neighbors
+
+
+def port_key(port) -> str:
+    """'gi1/0/25', 'Ethernet1/0/25', '1/0/25' -> '1/0/25' для сравнения портов FDB и LLDP"""
+    return "/".join(re.findall(r"\d+", str(port)))
+
+
+def neighbor_from_detail(local_port, raw) -> Neighbor:
+    """Сосед на известном локальном порту по его подробному выводу"""
+    name = SYSTEM_NAME.search(raw)
+    address = MGMT_ADDRESS.search(raw)
+    return Neighbor(
+        local_port=local_port,
+        address=address.group(1) if address else "",
+        name=name.group(1) if name else "",
+    )
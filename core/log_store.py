@@ -0,0 +1,136 @@
+import json
+import os
+import re
+from datetime import datetime
+
+from core import history
+from core.paths import data_path
+from core.records import LogEvent
+
+TIMESTAMP = re.compile(
+    r"\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}"
+    r"|\d{1,2}-[A-Za-z]{3}-\d{4}\s+\d{2}:\d{2}:\d{2}"
+    r"|%?[A-Za-z]{3}\s+\d+\s+\d+:\d+:\d+"
+)
+LINK_STATE = re.compile(r"\b(up|down)\b", re.I)
+TIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%d-%b-%Y %H:%M:%S", "%b %d %H:%M:%S")
+
+
+def event_from_line(line: str, port: str, log_id=None) -> LogEvent:
+    """Событие из строки лога: время и состояние UP/DOWN, если есть"""
+    ts = TIMESTAMP.search(line)
+    state = LINK_STATE.search(line)
+    return LogEvent(
+        log_id=log_id,
+        timestamp=ts.group(0) if ts else "",
+        port=str(port),
+        state=state.group(1).upper() if state else "",
+        text=line.strip(),
+    )
+
+
+def parse_timestamp(text: str):
+    """Отметка времени события -> datetime (без года - 1900 г.), None если формат неизвестен"""
+    text = re.sub(r"\s+", " ", text.lstrip("%"))
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def newest_first(events) -> bool:
+    """Порядок лога без номеров записей - по времени первой и последней записи"""
+    times = [t for t in (parse_timestamp(e.timestamp) for e in events) if t]
+    return len(times) >= 2 and times[0] > times[-1]
+
+
+def event_key(event: LogEvent):
+    """
+    Номер записи, время и текст. Одного номера мало: после перезагрузки
+    или clear log нумерация начинается заново, и новые записи совпали бы
+    по номеру со старыми. Потоковым строкам без времени watch ставит
+    время приема, иначе повтор того же флапа считался бы дублем.
+    """
+    return event.log_id, event.timestamp, event.text
+
+
+# ================== DEVICE LOG ==================
+class DeviceLog:
+    """
+    Локальная копия лога одного коммутатора с индексом по портам.
+    События хранятся от старых к новым и не теряются, когда кольцевой
+    буфер коммутатора их уже перезаписал.
+    """
+
+    def __init__(self, host: str, path: str):
+        self.host = host
+        self.path = path
+        self.events = []
+        self.by_port = {}
+        self._seen = set()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    self._index(LogEvent(*json.loads(line)))
+
+    def _index(self, event: LogEvent):
+        self.events.append(event)
+        self.by_port.setdefault(event.port, []).append(event)
+        self._seen.add(event_key(event))
+
+    def is_seen(self, event: LogEvent) -> bool:
+        return event_key(event) in self._seen
+
+    def add(self, events, newest_first=False) -> int:
+        """Добавляет еще не виденные события и дописывает их в файл"""
+        batch = list(reversed(events)) if newest_first else list(events)
+        fresh = []
+        for event in batch:
+            if event_key(event) in self._seen:
+                continue
+            self._index(event)
+            fresh.append(event)
+
+        if fresh:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                for event in fresh:
+                    f.write(json.dumps(list(event), ensure_ascii=False) + "\n")
+            history.record_log_events(self.host, fresh)
+        return len(fresh)
+
+    def port_history(self, port, limit=15):
+        """Последние limit событий порта, от старых к новым"""
+        return self.by_port.get(str(port), [])[-limit:]
+
+
+# ================== STORE ==================
+class LogStore:
+    def __init__(self, root=None):
+        self.root = root or data_path("logs")
+        self._devices = {}
+
+    def device(self, host: str) -> DeviceLog:
+        log = self._devices.get(host)
+        if log is None:
+            safe = re.sub(r"[^\w.-]", "_", host)
+            log = DeviceLog(host, os.path.join(self.root, f"{safe}.jsonl"))
+            self._devices[host] = log
+        return log
+
+
+_store = None
+
+
+def get_log_store() -> LogStore:
+    global _store
+    if _store is None:
+        _store = LogStore()
+    return _store
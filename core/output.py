@@ -0,0 +1,43 @@
+import io
+import sys
+import contextvars
+from contextlib import contextmanager
+
+# Буфер текущей задачи: print() из vendor-модулей попадает в него,
+# а не в общий stdout, поэтому отчеты параллельных запросов не смешиваются
+_buffer = contextvars.ContextVar("output_buffer", default=None)
+
+
+class _TaskStdout:
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, text):
+        buf = _buffer.get()
+        if buf is not None:
+            return buf.write(text)
+        return self._stream.write(text)
+
+    def flush(self):
+        if _buffer.get() is None:
+            self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def _install():
+    if not isinstance(sys.stdout, _TaskStdout):
+        sys.stdout = _TaskStdout(sys.stdout)
+
+
+@contextmanager
+def capture():
+    """Собирает вывод print() текущей задачи в строку: with capture() as buf"""
+    _install()
+    buf = io.StringIO()
+    token = _buffer.set(buf)
+    try:
+        yield buf
+    finally:
+        _buffer.reset(token)
@@ -0,0 +1,8 @@
+import os
+
+DEFAULT_HOME = os.path.join(os.path.expanduser("~"), ".telnet-switch-diag")
+
+
+def data_path(*parts):
+    """Путь внутри каталога данных (SWITCH_DIAG_HOME или ~/.telnet-switch-diag)"""
+    return os.path.join(os.environ.get("SWITCH_DIAG_HOME", DEFAULT_HOME), *parts)
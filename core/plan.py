@@ -0,0 +1,151 @@
+import json
+import os
+from typing import Callable, NamedTuple, Optional
+
+from core import filters
+from core.budget import section
+from core.paths import data_path
+
+
+class Step(NamedTuple):
+    """
+    Команда плана диагностики.
+    command - строка с подстановкой {port} и т.п. или функция(results, params).
+    needs - ключи шагов, которые должны выполниться раньше; when(results) -
+    выполнять ли шаг по уже полученным выводам (например, только при UP).
+    include/begin - образец для фильтра на стороне коммутатора (как command),
+    если прошивка его не знает - вывод фильтруется парсером на клиенте.
+    """
+    key: str
+    command: object
+    section: str = ""
+    needs: tuple = ()
+    when: Optional[Callable] = None
+    critical: bool = False
+    include: object = None
+    begin: object = None
+
+
+class PlanRun:
+    """Выводы выполненных шагов и учет пропущенных"""
+
+    def __init__(self, vendor: str):
+        self.vendor = vendor
+        self.results = {}
+        self.skipped = []     # не нужны при этом состоянии
+        self.missed = []      # не успели (бюджет диагностики)
+        self.sent_bytes = 0
+
+    def __contains__(self, key):
+        return key in self.results
+
+    def __getitem__(self, key):
+        return self.results[key]
+
+    def get(self, key, default=""):
+        return self.results.get(key, default)
+
+    @property
+    def skipped_bytes(self) -> int:
+        """Оценка по среднему объему вывода этих команд в прошлых диагностиках"""
+        return sum(_sizes.get(f"{self.vendor} {key}", 0) for key in self.skipped)
+
+    def summary(self) -> str:
+        line = (
+            f"Команд выполнено: {len(self.results)} ({format_size(self.sent_bytes)}), "
+            f"пропущено: {len(self.skipped)}"
+        )
+        if self.skipped_bytes:
+            line += f" (~{format_size(self.skipped_bytes)})"
+        return line
+
+
+def render(value, results, params):
+    if callable(value):
+        return value(results, params)
+    return value.format(**params) if value else None
+
+
+async def execute(plan, fetch, vendor: str, params=None, stops=None, host=""):
+    """
+    Выполняет шаги плана по порядку: шаг запускается, только если выполнены
+    все его needs и when(results) истинно. fetch(command, stop) -> вывод.
+    Шаги, зависящие от невыполненных, пропускаются без отправки команды.
+    """
+    params = params or {}
+    stops = stops or {}
+    run = PlanRun(vendor)
+
+    for step in plan:
+        if any(k in run.missed for k in step.needs):
+            run.missed.append(step.key)
+            continue
+        if any(k not in run.results for k in step.needs) or (step.when and not step.when(run.results)):
+            run.skipped.append(step.key)
+            continue
+
+        command = render(step.command, run.results, params)
+        include = render(step.include, run.results, params)
+        begin = render(step.begin, run.results, params)
+        with section(step.section or step.key, critical=step.critical, report=False):
+            run.results[step.key] = await filters.fetch(
+                fetch, host, vendor, command, include, begin, stops.get(step.key)
+            )
+        if step.key not in run.results:
+            run.missed.append(step.key)
+            continue
+
+        size = len(run.results[step.key].encode("utf-8"))
+        run.sent_bytes += size
+        _learn(f"{vendor} {step.key}", size)
+
+    load_sizes()
+    _totals["executed"] += len(run.results)
+    _totals["skipped"] += len(run.skipped)
+    _totals["skipped_bytes"] += run.skipped_bytes
+    return run
+
+
+def format_size(n: int) -> str:
+    return f"{n / 1024:.1f} КБ" if n >= 1024 else f"{n} Б"
+
+
+# ================== OUTPUT SIZES ==================
+# "вендор ключ" -> средний объем вывода, байт (экспоненциальное среднее)
+_sizes = {}
+_loaded = False
+_totals = {"executed": 0, "skipped": 0, "skipped_bytes": 0}
+
+
+def sizes_path():
+    return data_path("command_sizes.json")
+
+
+def _learn(name, size, weight=0.2):
+    load_sizes()
+    old = _sizes.get(name)
+    _sizes[name] = size if old is None else int(old + (size - old) * weight)
+
+
+def load_sizes(path=None):
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+    path = path or sizes_path()
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            _sizes.update(json.load(f))
+
+
+def save_sizes(path=None):
+    if not _sizes:
+        return
+    path = path or sizes_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(_sizes, f, ensure_ascii=False, indent=1)
+
+
+def totals():
+    return dict(_totals)
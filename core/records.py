@@ -0,0 +1,141 @@
+import re
+from array import array
+from typing import NamedTuple, Optional
+
+# ================== MAC ==================
+_MAC_HEX = re.compile(r"[^0-9A-Fa-f]")
+
+
+def mac_to_int(mac: str) -> int:
+    """'00-1A-2B-3C-4D-5E' / '00:1a:..' / '001a.2b3c.4d5e' -> 48-битное число"""
+    digits = _MAC_HEX.sub("", mac)
+    if len(digits) != 12:
+        raise ValueError(f"not a MAC address: {mac!r}")
+    return int(digits, 16)
+
+
+def format_mac(value: int, sep: str = "-", group: int = 2, upper: bool = False) -> str:
+    """48-битное число -> строка в формате вендора"""
+    digits = f"{value:012X}" if upper else f"{value:012x}"
+    return sep.join(digits[i:i + group] for i in range(0, 12, group))
+
+
+def to_int(value, default=0) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def speed_to_bps(speed) -> int:
+    """'100M', '1000Mbps', '1 Gbps', '10G' -> бит/с (0, если не распознано)"""
+    m = re.search(r"(\d+(?:\.\d+)?)\s*([MG])", str(speed), re.I)
+    if not m:
+        return 0
+    scale = 1_000_000_000 if m.group(2).upper() == "G" else 1_000_000
+    return int(float(m.group(1)) * scale)
+
+
+def stack_port(port) -> str:
+    """'2' -> '1/0/2': так порт пишут SNR и Eltex (юнит/слот/порт)"""
+    port = str(port)
+    return port if "/" in port else f"1/0/{port}"
+
+
+# ================== RECORDS ==================
+class MacEntry(NamedTuple):
+    mac: int
+    vlan: int
+    port: str = ""
+    type: str = ""
+    time: str = ""
+
+
+class PortCounters(NamedTuple):
+    host: str
+    port: str
+    state: str
+    speed: str = "N/A"
+    in_rate: int = 0        # бит/с
+    out_rate: int = 0       # бит/с
+    in_errors: int = 0
+    out_errors: int = 0
+    crc: int = 0
+    # False - счетчики ошибок не сняты (порт DOWN, истек бюджет): нули в
+    # полях выше не данные, в историю и снимок для прироста такое не пишется
+    complete: bool = True
+
+
+class Neighbor(NamedTuple):
+    local_port: str
+    address: str = ""     # IPv4 управления соседа
+    name: str = ""
+
+
+class LogEvent(NamedTuple):
+    log_id: Optional[int]
+    timestamp: str
+    port: str
+    state: str
+    text: str = ""
+
+
+# ================== COLUMNAR TABLE ==================
+class MacTable:
+    """
+    Колоночное хранение больших FDB: MAC/VLAN лежат в array, имена портов
+    и типы записей хранятся один раз и адресуются индексом. Поле time
+    в колоночной форме не хранится.
+    """
+
+    __slots__ = ("_macs", "_vlans", "_ports", "_types", "_names", "_name_index")
+
+    def __init__(self, entries=()):
+        self._macs = array("Q")
+        self._vlans = array("H")
+        self._ports = array("H")
+        self._types = array("H")
+        self._names = []
+        self._name_index = {}
+        for entry in entries:
+            self.append(entry)
+
+    def _intern(self, name: str) -> int:
+        idx = self._name_index.get(name)
+        if idx is None:
+            idx = len(self._names)
+            self._names.append(name)
+            self._name_index[name] = idx
+        return idx
+
+    def append(self, entry: MacEntry):
+        self._macs.append(entry.mac)
+        self._vlans.append(entry.vlan)
+        self._ports.append(self._intern(entry.port))
+        self._types.append(self._intern(entry.type))
+
+    def __len__(self):
+        return len(self._macs)
+
+    def __getitem__(self, i) -> MacEntry:
+        names = self._names
+        return MacEntry(
+            self._macs[i], self._vlans[i],
+            names[self._ports[i]], names[self._types[i]],
+        )
+
+    def __iter__(self):
+        for i in range(len(self._macs)):
+            yield self[i]
+
+    def find(self, mac: int) -> Optional[MacEntry]:
+        for i, value in enumerate(self._macs):
+            if value == mac:
+                return self[i]
+        return None
+
+    def on_port(self, port: str):
+        idx = self._name_index.get(port)
+        if idx is None:
+            return []
+        return [self[i] for i, p in enumerate(self._ports) if p == idx]
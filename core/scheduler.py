@@ -0,0 +1,228 @@
+import asyncio
+import contextvars
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+# ================== PRIORITIES ==================
+INTERACTIVE = 0   # helpdesk: оператор ждёт ответа
+BACKGROUND = 1    # фоновый обход сети
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+# Приоритет задаётся контекстом задачи, чтобы не протаскивать его
+# через сигнатуры всех vendor-модулей
+_priority = contextvars.ContextVar("scheduler_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def priority(level: int):
+    """Задает класс приоритета для всех сессий внутри блока"""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+# ================== SCHEDULER ==================
+class Scheduler:
+    """
+    Ограничивает одновременные telnet-сессии: глобально и на каждый хост.
+    Ожидающие обслуживаются по приоритету, а внутри приоритета - по кругу
+    между хостами, чтобы один большой коммутатор не занимал все слоты.
+    """
+
+    def __init__(self, max_sessions=32, per_host=2, per_host_rate=5.0):
+        self.max_sessions = max_sessions
+        self.per_host = per_host
+        # команд в секунду на один хост (0 - без ограничения)
+        self.per_host_rate = per_host_rate
+
+        self._active = 0
+        self._active_by_host = {}
+        # priority -> OrderedDict(host -> deque[future])
+        self._waiters = {}
+        self._next_command_at = {}
+
+        self._wait_stats = {}
+
+    # ---------- sessions ----------
+    def _can_start(self, host):
+        return (
+            self._active < self.max_sessions
+            and self._active_by_host.get(host, 0) < self.per_host
+        )
+
+    def _grant(self, host):
+        self._active += 1
+        self._active_by_host[host] = self._active_by_host.get(host, 0) + 1
+
+    def _has_waiters(self):
+        return any(hosts for hosts in self._waiters.values())
+
+    async def acquire(self, host: str):
+        """Ждет свободный слот для сессии к host, возвращает время ожидания"""
+        level = _priority.get()
+        started = time.monotonic()
+
+        if not self._has_waiters() and self._can_start(host):
+            self._grant(host)
+        else:
+            future = asyncio.get_running_loop().create_future()
+            hosts = self._waiters.setdefault(level, OrderedDict())
+            hosts.setdefault(host, deque()).append(future)
+            # слот может быть свободен, если очередь стоит на лимитах других хостов
+            self._wake()
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # слот уже выдан, но задача отменена - возвращаем его
+                    self.release(host)
+                else:
+                    self._drop_waiter(level, host, future)
+                raise
+
+        waited = time.monotonic() - started
+        self._record_wait(level, waited)
+        return waited
+
+    def release(self, host: str):
+        """Освобождает слот сессии и передает его следующему ожидающему"""
+        self._active -= 1
+        left = self._active_by_host.get(host, 1) - 1
+        if left:
+            self._active_by_host[host] = left
+        else:
+            self._active_by_host.pop(host, None)
+        self._wake()
+
+    def _drop_waiter(self, level, host, future):
+        hosts = self._waiters.get(level, {})
+        queue = hosts.get(host)
+        if queue and future in queue:
+            queue.remove(future)
+            if not queue:
+                del hosts[host]
+        # удаление могло разблокировать соседей по очереди
+        self._wake()
+
+    def _wake(self):
+        while self._active < self.max_sessions:
+            picked = self._pick_next()
+            if picked is None:
+                return
+            host, future = picked
+            self._grant(host)
+            future.set_result(None)
+
+    def _pick_next(self):
+        for level in sorted(self._waiters):
+            hosts = self._waiters[level]
+            for host in list(hosts):
+                if self._active_by_host.get(host, 0) >= self.per_host:
+                    continue
+                queue = hosts[host]
+                future = queue.popleft()
+                # хост уходит в конец круга
+                del hosts[host]
+                if queue:
+                    hosts[host] = queue
+                if future.cancelled():
+                    return self._pick_next()
+                return host, future
+        return None
+
+    # ---------- command rate ----------
+    async def pace(self, host: str):
+        """Выдерживает интервал между командами на один хост"""
+        if not self.per_host_rate:
+            return
+        interval = 1.0 / self.per_host_rate
+        now = time.monotonic()
+        slot = max(now, self._next_command_at.get(host, 0.0))
+        self._next_command_at[host] = slot + interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    # ---------- stats ----------
+    def _record_wait(self, level, waited):
+        stats = self._wait_stats.setdefault(level, {"count": 0, "total": 0.0, "max": 0.0})
+        stats["count"] += 1
+        stats["total"] += waited
+        stats["max"] = max(stats["max"], waited)
+
+    def stats(self):
+        """Статистика ожидания в очереди по классам приоритета"""
+        result = {}
+        for level, s in sorted(self._wait_stats.items()):
+            result[PRIORITY_NAMES.get(level, str(level))] = {
+                "sessions": s["count"],
+                "avg_wait": s["total"] / s["count"] if s["count"] else 0.0,
+                "max_wait": s["max"],
+            }
+        return result
+
+    def report(self):
+        lines = ["===== SCHEDULER QUEUE ====="]
+        for name, s in self.stats().items():
+            lines.append(
+                f"{name:<12}: сессий {s['sessions']}, "
+                f"ожидание ср. {s['avg_wait']:.3f}s, макс. {s['max_wait']:.3f}s"
+            )
+        return "\n".join(lines)
+
+
+class ScheduledWriter:
+    """
+    Обертка над writer: закрытие соединения возвращает слот планировщику.
+    on_close(writer) может забрать соединение себе (пул сессий) - тогда
+    оно не закрывается.
+    """
+
+    def __init__(self, writer, scheduler: Scheduler, host: str, on_close=None):
+        self._writer = writer
+        self._scheduler = scheduler
+        self.host = host
+        self._on_close = on_close
+        self._released = False
+
+    def discard(self):
+        """Соединение в неизвестном состоянии (прерванная команда) - не в пул"""
+        self._on_close = None
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        try:
+            if not (self._on_close and self._on_close(self._writer)):
+                self._writer.close()
+        finally:
+            self._scheduler.release(self.host)
+
+    def __getattr__(self, name):
+        return getattr(self._writer, name)
+
+
+# ================== GLOBAL INSTANCE ==================
+_scheduler = Scheduler()
+
+
+def get_scheduler() -> Scheduler:
+    return _scheduler
+
+
+def configure(**kwargs) -> Scheduler:
+    """Заменяет глобальный планировщик (лимиты задаются до запуска сессий)"""
+    global _scheduler
+    _scheduler = Scheduler(**kwargs)
+    return _scheduler
+
+
+async def pace_command(writer):
+    """Ограничение частоты команд для writer, полученного из telnet_connect"""
+    host = getattr(writer, "host", None)
+    if host is not None:
+        await get_scheduler().pace(host)
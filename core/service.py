@@ -0,0 +1,194 @@
+import asyncio
+import hmac
+import json
+import time
+from urllib.parse import urlsplit, parse_qs
+
+from core.budget import deadline, section, parse_budget
+from core.detect_vendor import detect_vendor
+from core.output import capture
+from core.scheduler import get_scheduler
+from core.session_pool import enable_pool
+from core.sweep import is_loopback
+from core import transport, plan
+
+HTTP_STATUS = {
+    200: "OK",
+    400: "Bad Request",
+    401: "Unauthorized",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    502: "Bad Gateway",
+}
+
+# запрос диагностики - несколько полей JSON, больше не нужно
+MAX_BODY = 64 * 1024
+
+
+# ================== SERVICE ==================
+class DiagService:
+    """
+    Демон диагностики: один event loop, запросы по HTTP/JSON.
+    Вендор хоста и авторизованные сессии сохраняются между запросами.
+    """
+
+    def __init__(self, diagnose, password, vendor_ttl=3600.0, session_ttl=60.0, budget=None,
+                 token=None):
+        self.diagnose = diagnose
+        self.password = password
+        # ключ клиентов: заголовок "Authorization: Bearer <token>"
+        self.token = token
+        # срок диагностики по умолчанию, запрос может задать свой (budget=5s)
+        self.budget = budget
+        self.vendor_ttl = vendor_ttl
+        self.pool = enable_pool(idle_ttl=session_ttl)
+        # host -> (vendor, detected_at)
+        self._vendors = {}
+        self.requests = 0
+
+    async def get_vendor(self, host: str):
+        cached = self._vendors.get(host)
+        if cached and time.monotonic() - cached[1] < self.vendor_ttl:
+            return cached[0]
+        vendor = await detect_vendor(host, self.password)
+        if vendor != "UNKNOWN":
+            self._vendors[host] = (vendor, time.monotonic())
+        return vendor
+
+    async def run_diag(self, host: str, port: str, budget=None):
+        self.requests += 1
+        started = time.monotonic()
+        vendor = None
+        # определение вендора входит в срок диагностики
+        with deadline(budget or self.budget) as spent, capture() as buf:
+            with section("VENDOR", critical=True, report=False):
+                vendor = await self.get_vendor(host)
+            if vendor is not None:
+                await self.diagnose(host, port, self.password, vendor=vendor)
+        return {
+            "host": host,
+            "port": port,
+            "vendor": vendor,
+            "report": buf.getvalue(),
+            "missing": spent.missing if spent else [],
+            "elapsed": round(time.monotonic() - started, 3),
+        }
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "vendors": {h: v for h, (v, _) in self._vendors.items()},
+            "sessions": self.pool.stats(),
+            "scheduler": get_scheduler().stats(),
+            "commands": plan.totals(),
+        }
+
+    # ---------- HTTP ----------
+    def authorized(self, headers) -> bool:
+        if self.token is None:
+            return True  # только loopback или unix-сокет, см. serve
+        scheme, _, token = headers.get("authorization", "").partition(" ")
+        return scheme.lower() == "bearer" and hmac.compare_digest(
+            token.strip().encode(), self.token.encode()
+        )
+
+    async def route(self, method, path, query, body):
+        if path == "/health":
+            return 200, {"status": "ok"}
+        if path == "/stats":
+            return 200, self.stats()
+        if path != "/diag":
+            return 404, {"error": "not found"}
+
+        if method == "POST":
+            try:
+                params = json.loads(body or b"{}")
+            except ValueError:
+                return 400, {"error": "invalid JSON"}
+            if not isinstance(params, dict):
+                return 400, {"error": "JSON body must be an object"}
+        elif method == "GET":
+            params = {k: v[0] for k, v in query.items()}
+        else:
+            return 405, {"error": "use GET or POST"}
+
+        host = params.get("host")
+        port = params.get("port")
+        if not host or not port:
+            return 400, {"error": "host and port are required"}
+        try:
+            budget = parse_budget(str(params["budget"])) if params.get("budget") else None
+        except ValueError as e:
+            return 400, {"error": str(e)}
+
+        try:
+            return 200, await self.run_diag(str(host), str(port), budget)
+        except Exception as e:
+            return 502, {"host": host, "port": port, "error": str(e) or type(e).__name__}
+
+    async def handle_client(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode("latin-1").strip()
+            if not request_line:
+                writer.close()
+                return
+            method, target, _ = request_line.split(" ", 2)
+
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1").strip()
+                if not line:
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            length = int(headers.get("content-length", 0) or 0)
+            if length < 0:
+                raise ValueError(length)
+
+            # ключ и размер проверяются до чтения тела
+            if not self.authorized(headers):
+                status, payload = 401, {"error": "unauthorized"}
+            elif length > MAX_BODY:
+                status, payload = 413, {"error": f"body exceeds {MAX_BODY} bytes"}
+            else:
+                body = await reader.readexactly(length) if length else b""
+                url = urlsplit(target)
+                status, payload = await self.route(method.upper(), url.path, parse_qs(url.query), body)
+
+        except (ValueError, asyncio.IncompleteReadError):
+            status, payload = 400, {"error": "malformed request"}
+
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {HTTP_STATUS[status]}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: close\r\n\r\n".encode("latin-1") + data
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8080, unix_path=None):
+        """
+        Без token слушать можно только loopback или unix-сокет: сервис
+        входит на коммутаторы с учетными данными оператора.
+        """
+        if self.token is None and not unix_path and not is_loopback(host):
+            raise ValueError(f"{host}: для приема удаленных запросов нужен token")
+        if unix_path:
+            server = await asyncio.start_unix_server(self.handle_client, path=unix_path)
+            print(f"Сервис диагностики: unix:{unix_path}")
+        else:
+            server = await asyncio.start_server(self.handle_client, host, port)
+            print(f"Сервис диагностики: http://{host}:{port}")
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.pool.close()
+            transport.close_all()
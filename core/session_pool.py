@@ -0,0 +1,111 @@
+import asyncio
+import time
+
+# ================== WARM SESSIONS ==================
+class SessionPool:
+    """
+    Держит авторизованные telnet-сессии между запросами.
+    Закрытие writer в vendor-модуле возвращает сессию в пул,
+    следующий telnet_connect к тому же хосту забирает её без логина.
+    """
+
+    def __init__(self, idle_ttl=60.0, per_host=1):
+        self.idle_ttl = idle_ttl
+        self.per_host = per_host
+        # (host, credentials) -> [(reader, writer, parked_at)]
+        self._idle = {}
+        self._reaper = None
+        self.hits = 0
+        self.misses = 0
+
+    async def checkout(self, host: str, credentials):
+        """Возвращает (reader, writer) живой сессии или None"""
+        sessions = self._idle.get((host, credentials))
+        while sessions:
+            reader, writer, parked_at = sessions.pop()
+            if not _alive(reader, writer) or time.monotonic() - parked_at > self.idle_ttl:
+                writer.close()
+                continue
+            await _drain(reader)
+            self.hits += 1
+            return reader, writer
+        self.misses += 1
+        return None
+
+    def checkin(self, host: str, credentials, reader, writer) -> bool:
+        """Паркует сессию; False - сессию нужно закрыть"""
+        if not _alive(reader, writer):
+            return False
+        sessions = self._idle.setdefault((host, credentials), [])
+        if len(sessions) >= self.per_host:
+            return False
+        sessions.append((reader, writer, time.monotonic()))
+        self._ensure_reaper()
+        return True
+
+    def _ensure_reaper(self):
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.get_running_loop().create_task(self._reap())
+
+    async def _reap(self):
+        while self._idle:
+            await asyncio.sleep(self.idle_ttl / 2)
+            now = time.monotonic()
+            for key, sessions in list(self._idle.items()):
+                keep = []
+                for reader, writer, parked_at in sessions:
+                    if now - parked_at > self.idle_ttl or not _alive(reader, writer):
+                        writer.close()
+                    else:
+                        keep.append((reader, writer, parked_at))
+                if keep:
+                    self._idle[key] = keep
+                else:
+                    del self._idle[key]
+
+    def close(self):
+        for sessions in self._idle.values():
+            for _, writer, _ in sessions:
+                writer.close()
+        self._idle.clear()
+        if self._reaper is not None:
+            self._reaper.cancel()
+
+    def stats(self):
+        return {
+            "idle_sessions": sum(len(s) for s in self._idle.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def _alive(reader, writer) -> bool:
+    if reader.at_eof():
+        return False
+    transport = getattr(writer, "transport", None)
+    return transport is None or not transport.is_closing()
+
+
+async def _drain(reader, timeout=0.05):
+    """Вычитывает остатки вывода прошлой команды"""
+    while True:
+        try:
+            chunk = await asyncio.wait_for(reader.read(4096), timeout=timeout)
+        except asyncio.TimeoutError:
+            return
+        if not chunk:
+            return
+
+
+# ================== GLOBAL INSTANCE ==================
+_pool = None
+
+
+def get_pool():
+    return _pool
+
+
+def enable_pool(**kwargs) -> SessionPool:
+    global _pool
+    _pool = SessionPool(**kwargs)
+    return _pool
@@ -0,0 +1,151 @@
+import asyncio
+import codecs
+import os
+
+try:
+    import paramiko
+except ImportError:  # SSH необязателен: без paramiko работает только telnet
+    paramiko = None
+
+from core import transport
+from core.telnet_common import LoginError, SHELL_PROMPT, read_until
+
+
+# ================== CHANNEL STREAMS ==================
+class SSHReader:
+    """Асинхронное чтение из канала paramiko через его fileno()"""
+
+    def __init__(self, channel):
+        self._chan = channel
+        self._fd = channel.fileno()
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    async def read(self, n=2048) -> str:
+        loop = asyncio.get_running_loop()
+        while True:
+            if self._chan.recv_ready():
+                return self._decoder.decode(self._chan.recv(n))
+            if self._chan.closed or self._chan.eof_received:
+                return ""
+            ready = loop.create_future()
+            loop.add_reader(self._fd, lambda: ready.done() or ready.set_result(None))
+            try:
+                await ready
+            finally:
+                loop.remove_reader(self._fd)
+
+    def at_eof(self) -> bool:
+        return self._chan.closed or (self._chan.eof_received and not self._chan.recv_ready())
+
+
+class SSHWriter:
+    def __init__(self, channel):
+        self._chan = channel
+
+    def write(self, data: str):
+        self._chan.sendall(data.replace("\n", "\r").encode("utf-8"))
+
+    def is_closing(self) -> bool:
+        return self._chan.closed
+
+    def close(self):
+        self._chan.close()
+
+
+# ================== TRANSPORT ==================
+class SSHTransport(transport.Transport):
+    """
+    Одно авторизованное SSH-соединение на коммутатор, каждая сессия -
+    отдельный shell-канал поверх него. Параллельные и последовательные
+    сессии одной диагностики не повторяют рукопожатие и логин.
+
+    Ключ коммутатора сверяется с системным known_hosts и файлом host_keys;
+    неизвестный ключ отклоняется. accept_new - принимать ключи новых
+    коммутаторов и дописывать их в host_keys (доверие при первом входе).
+    """
+
+    name = "ssh"
+
+    def __init__(self, port=22, connect_timeout=5.0, prompt_timeout=5.0, host_keys=None,
+                 accept_new=False):
+        if paramiko is None:
+            raise RuntimeError("для SSH-транспорта установите paramiko")
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.prompt_timeout = prompt_timeout
+        self.host_keys = os.path.expanduser(host_keys) if host_keys else None
+        self.accept_new = accept_new
+        # (host, credentials) -> paramiko.SSHClient
+        self._clients = {}
+        self._locks = {}
+
+    async def open(self, host, credentials):
+        client = await self._client(host, credentials)
+        channel = await asyncio.to_thread(self._open_channel, client)
+        reader, writer = SSHReader(channel), SSHWriter(channel)
+        try:
+            await read_until(reader, (SHELL_PROMPT,), self.prompt_timeout)
+        except asyncio.TimeoutError:
+            # приглашение не распознано - как и в telnet, работаем дальше
+            pass
+        return reader, writer
+
+    async def _client(self, host, credentials):
+        key = (host, credentials)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            client = self._clients.get(key)
+            if client is not None and client.get_transport() and client.get_transport().is_active():
+                return client
+            client = await self._connect(host, credentials)
+            self._clients[key] = client
+            return client
+
+    async def _connect(self, host, credentials):
+        for username, password in credentials:
+            client = self._new_client()
+            try:
+                await asyncio.to_thread(
+                    client.connect, host, port=self.port,
+                    username=username, password=password,
+                    timeout=self.connect_timeout, auth_timeout=self.connect_timeout,
+                    look_for_keys=False, allow_agent=False,
+                )
+                return client
+            except paramiko.AuthenticationException:
+                client.close()
+            except BaseException:
+                client.close()
+                raise
+        raise LoginError(f"{host}: SSH-авторизация не удалась, перебрано учетных записей: {len(credentials)}")
+
+    def _new_client(self):
+        client = paramiko.SSHClient()
+        client.load_system_host_keys()
+        if self.host_keys:
+            # как и у ssh, отсутствующий файл - пустой список ключей
+            if self.accept_new and not os.path.exists(self.host_keys):
+                open(self.host_keys, "a").close()
+            if os.path.exists(self.host_keys):
+                # после загрузки AutoAddPolicy сохраняет новые ключи в этот файл
+                client.load_host_keys(self.host_keys)
+        if self.accept_new:
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        else:
+            client.set_missing_host_key_policy(paramiko.RejectPolicy())
+        return client
+
+    @staticmethod
+    def _open_channel(client):
+        channel = client.get_transport().open_session()
+        channel.get_pty(width=200, height=1000)
+        channel.invoke_shell()
+        return channel
+
+    def close(self):
+        for client in self._clients.values():
+            client.close()
+        self._clients.clear()
+
+
+transport.register("ssh", SSHTransport)
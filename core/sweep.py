@@ -0,0 +1,313 @@
+import asyncio
+import hmac
+import ipaddress
+import json
+import os
+import sys
+import time
+from collections import deque
+
+from core.output import capture
+from core.records import PortCounters
+from core.scheduler import priority, BACKGROUND
+
+# Протокол координатор <-> воркер: JSON по строке в каждую сторону.
+#   воркер:      {"op": "hello", "token": ...}
+#                                -> {"op": "denied"} и разрыв, если token не подошел
+#                {"op": "next"}  -> {"op": "work", "shard": id, "host": ..., "ports": [...]}
+#                                   {"op": "wait"} - работа есть, но вся уже роздана
+#                                   {"op": "done"} - обход закончен
+#                {"op": "result", "shard": id, "host": ..., "port": ..., "vendor": ...,
+#                 "counters": {...} | null, "error": str | null}
+
+
+def encode(message) -> bytes:
+    return (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+async def receive(reader):
+    line = await reader.readline()
+    return json.loads(line) if line else None
+
+
+def is_loopback(host: str) -> bool:
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return host == "localhost"
+
+
+def shard_targets(targets):
+    """Порты одного коммутатора - один шард: вендор и сессии у воркера общие"""
+    shards = {}
+    for host, port in targets:
+        shards.setdefault(host, []).append(port)
+    return list(shards.items())
+
+
+# ================== CHECKPOINT ==================
+def load_checkpoint(path):
+    """
+    Результаты прошлого прерванного обхода: (host, port) -> запись.
+    Повторный результат порта (после --resume) заменяет прежний.
+    """
+    done = {}
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # последняя строка могла не дописаться при прерывании
+                    continue
+                done[(record["host"], record["port"])] = record
+    return done
+
+
+# ================== COORDINATOR ==================
+class Coordinator:
+    """
+    Раздает шарды воркерам по запросу (кто освободился, тот и берет),
+    принимает результаты потоком и пишет их в checkpoint.
+    Когда очередь пуста, шард, который обрабатывается дольше steal_after,
+    выдается еще одному свободному воркеру - засчитывается первый ответ.
+    """
+
+    def __init__(self, targets, checkpoint=None, resume=False, steal_after=30.0,
+                 token=None, on_result=None):
+        self.checkpoint = checkpoint
+        self.steal_after = steal_after
+        self.token = token
+        self.on_result = on_result
+        if checkpoint and not resume and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        # порты, опрос которых закончился ошибкой, при продолжении опрашиваются снова
+        self.results = {
+            key: record for key, record in load_checkpoint(checkpoint).items()
+            if not record.get("error")
+        } if resume else {}
+
+        # shard id -> [host, оставшиеся порты]
+        self.shards = {}
+        self.pending = deque()
+        for i, (host, ports) in enumerate(shard_targets(targets)):
+            left = [p for p in dict.fromkeys(ports) if (host, p) not in self.results]
+            if left:
+                self.shards[i] = [host, left]
+                self.pending.append(i)
+        self.total = len(self.results) + sum(len(s[1]) for s in self.shards.values())
+
+        # shard id -> (время выдачи, {воркеры})
+        self.inflight = {}
+        self.workers = 0
+        self.finished = asyncio.Event()
+        self._file = None
+        if not self.shards:
+            self.finished.set()
+
+    # ---------- раздача ----------
+    def next_shard(self, worker):
+        if self.pending:
+            shard = self.pending.popleft()
+            self.inflight[shard] = (time.monotonic(), {worker})
+            return shard
+        # кража: самый давно выданный шард, который этот воркер еще не делает
+        now = time.monotonic()
+        for shard, (started, owners) in sorted(self.inflight.items(), key=lambda i: i[1][0]):
+            if worker not in owners and len(owners) < 2 and now - started > self.steal_after:
+                owners.add(worker)
+                return shard
+        return None
+
+    def release(self, worker):
+        """Воркер отключился: его незаконченные шарды - обратно в очередь"""
+        for shard, (started, owners) in list(self.inflight.items()):
+            owners.discard(worker)
+            if not owners:
+                del self.inflight[shard]
+                self.pending.appendleft(shard)
+
+    # ---------- результаты ----------
+    def record(self, message):
+        host, port = message["host"], message["port"]
+        if (host, port) in self.results:
+            return  # дубликат от украденного шарда
+        record = {k: message.get(k) for k in ("host", "port", "vendor", "counters", "error")}
+        self.results[(host, port)] = record
+        if self.checkpoint:
+            if self._file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.checkpoint)), exist_ok=True)
+                self._file = open(self.checkpoint, "a", encoding="utf-8")
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+        shard = self.shards.get(message.get("shard"))
+        if shard and port in shard[1]:
+            shard[1].remove(port)
+            if not shard[1]:
+                self.inflight.pop(message["shard"], None)
+        if self.on_result:
+            self.on_result(record, len(self.results), self.total)
+        if len(self.results) >= self.total:
+            self.finished.set()
+
+    # ---------- сеть ----------
+    def authorized(self, token) -> bool:
+        if self.token is None:
+            return True  # только loopback, см. serve
+        return isinstance(token, str) and hmac.compare_digest(token.encode(), self.token.encode())
+
+    async def handle_worker(self, reader, writer):
+        worker = object()
+        self.workers += 1
+        try:
+            hello = await receive(reader)
+            if not hello or hello.get("op") != "hello" or not self.authorized(hello.get("token")):
+                writer.write(encode({"op": "denied"}))
+                await writer.drain()
+                return
+            while True:
+                message = await receive(reader)
+                if message is None:
+                    return
+                if message["op"] == "result":
+                    self.record(message)
+                elif message["op"] == "next":
+                    if self.finished.is_set():
+                        writer.write(encode({"op": "done"}))
+                        continue
+                    shard = self.next_shard(worker)
+                    if shard is None:
+                        writer.write(encode({"op": "wait"}))
+                    else:
+                        host, ports = self.shards[shard]
+                        writer.write(encode({"op": "work", "shard": shard, "host": host, "ports": list(ports)}))
+                await writer.drain()
+        except (ConnectionError, ValueError, KeyError):
+            return
+        finally:
+            self.workers -= 1
+            self.release(worker)
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=0):
+        """
+        Запускает сервер, возвращает (server, адрес для воркеров).
+        Без token слушать можно только loopback: иначе любой подключившийся
+        забирал бы шарды и подкладывал свои результаты.
+        """
+        if self.token is None and not is_loopback(host):
+            raise ValueError(f"{host}: для приема удаленных воркеров нужен token")
+        server = await asyncio.start_server(self.handle_worker, host, port)
+        bound = server.sockets[0].getsockname()
+        return server, f"{bound[0]}:{bound[1]}"
+
+    async def wait_finished(self, processes, poll=1.0) -> bool:
+        """
+        Ждет конца обхода. False - все локальные воркеры завершились и
+        подключенных нет: сам обход уже не закончится.
+        """
+        while not self.finished.is_set():
+            if processes and not self.workers and all(p.returncode is not None for p in processes):
+                return False
+            try:
+                await asyncio.wait_for(self.finished.wait(), timeout=poll)
+            except asyncio.TimeoutError:
+                pass
+        return True
+
+    async def drain_workers(self, timeout=5.0):
+        """После обхода дает воркерам забрать 'done' и отключиться"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self.workers and loop.time() < deadline:
+            await asyncio.sleep(0.1)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def counters(self):
+        return [
+            PortCounters(**r["counters"]) for r in self.results.values() if r.get("counters")
+        ]
+
+
+async def spawn_workers(count, address, args):
+    """
+    Локальные воркеры - отдельные процессы со своим event loop. Вывод
+    воркера (ошибки запуска и подключения) идет в вывод координатора,
+    отчеты диагностики воркер и так не печатает.
+    """
+    main = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+    return [
+        await asyncio.create_subprocess_exec(
+            sys.executable, main, "worker", "--connect", address, *args,
+        )
+        for _ in range(count)
+    ]
+
+
+# ================== WORKER ==================
+async def run_worker(address, password, diagnose, concurrency=4, token=None,
+                     budget=None, poll=1.0):
+    """
+    Берет шарды у координатора, пока у него есть работа, и отправляет
+    результат каждого порта сразу по готовности.
+    Координатор отклонил token - PermissionError.
+    """
+    host, _, port = address.rpartition(":")
+    reader, writer = await asyncio.open_connection(host, int(port))
+    writer.write(encode({"op": "hello", "token": token}))
+
+    async def run_shard(message):
+        shard, host = message["shard"], message["host"]
+        vendor = None
+        for port in message["ports"]:
+            counters = error = None
+            with priority(BACKGROUND), capture():
+                try:
+                    vendor, counters = await diagnose(host, port, password, vendor=vendor, budget=budget)
+                except Exception as e:
+                    error = str(e) or type(e).__name__
+            if counters is None and error is None:
+                error = f"нет результата ({vendor})"
+            writer.write(encode({
+                "op": "result", "shard": shard, "host": host, "port": port, "vendor": vendor,
+                "counters": counters._asdict() if counters else None, "error": error,
+            }))
+            await writer.drain()
+
+    running = set()
+    finished = False
+    try:
+        while not finished or running:
+            idle = False
+            if not finished and len(running) < concurrency:
+                writer.write(encode({"op": "next"}))
+                await writer.drain()
+                message = await receive(reader)
+                if message is not None and message["op"] == "denied":
+                    raise PermissionError(f"координатор {address} отклонил token")
+                if message is None or message["op"] == "done":
+                    finished = True
+                elif message["op"] == "work":
+                    running.add(asyncio.create_task(run_shard(message)))
+                    continue
+                else:
+                    idle = True
+
+            if running:
+                timeout = poll if idle or len(running) < concurrency else None
+                done, running = await asyncio.wait(
+                    running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    task.result()
+            elif not finished:
+                await asyncio.sleep(poll)
+    finally:
+        for task in running:
+            task.cancel()
+        writer.close()
@@ -1,6 +1,10 @@
 import asyncio
 import telnetlib3
 import re
+from core.scheduler import ScheduledWriter, get_scheduler, pace_command
+from core.session_pool import get_pool
+from core.credentials import normalize_credentials
+from core import transport, budget
 
 ANSI = re.compile(r'\x1B[@-_][0-?]*[ -/]*[@-~]')
 
@@ -13,38 +17,230 @@ def clean_line(line: str) -> str:
     return line.strip()
 
 
-async def telnet_connect(host: str, password: str):
-    """Создает Telnet-соединение и возвращает reader, writer"""
-    reader, writer = await telnetlib3.open_connection(host=host, port=23)
+# ================== LOGIN ==================
+USER_PROMPT = re.compile(r"(user\s*name|login)\s*:\s*$", re.I)
+PASSWORD_PROMPT = re.compile(r"pass(word)?\s*:\s*$", re.I)
+SHELL_PROMPT = re.compile(r"[>#]\s*$")
+LOGIN_FAILED = re.compile(
+    r"fail|incorrect|invalid|denied|bad password|locked|blocked",
+    re.I
+)
 
-    # login
-    writer.write("admin\n")
-    await asyncio.sleep(0.5)
+# host -> (логин, пароль), подошедшие в последний раз: пробуются первыми
+_working_credentials = {}
+
+
+def at_prompt(text: str) -> bool:
+    """Вывод закончился приглашением CLI, а не страницей 'More'"""
+    return bool(SHELL_PROMPT.search(ANSI.sub("", text).rstrip("\x00")))
+
+
+class LoginError(Exception):
+    """Коммутатор отклонил все учетные данные или не выдал приглашение"""
+
+
+async def read_until(reader, patterns, timeout, partial=False):
+    """
+    Читает до совпадения одного из patterns; возвращает (индекс, текст).
+    partial - по таймауту вернуть (None, прочитанное) вместо TimeoutError.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    buf = ""
+    while True:
+        left = deadline - loop.time()
+        try:
+            if left <= 0:
+                raise asyncio.TimeoutError
+            chunk = await asyncio.wait_for(reader.read(1024), timeout=left)
+        except asyncio.TimeoutError:
+            if partial:
+                return None, buf
+            raise
+        if not chunk:
+            raise ConnectionResetError("соединение закрыто коммутатором")
+        buf += chunk
+        tail = ANSI.sub("", buf).rstrip("\x00")
+        for i, pattern in enumerate(patterns):
+            if pattern.search(tail):
+                return i, buf
+
+
+async def login(reader, writer, username, password, timeout=5.0, prompt=None):
+    """
+    Проходит диалог Username/Password по мере появления приглашений.
+    prompt - уже полученное приглашение (0 - логин, 1 - пароль), если
+    коммутатор выдал его вместе с отказом на прошлой попытке.
+    Возвращает (успех, приглашение для следующей попытки).
+    Разрыв до отправки пароля - ConnectionRefusedError: коммутатор отказал
+    в сессии (D-Link при превышении числа сессий), а не в учетных данных.
+    """
+    try:
+        if prompt is None:
+            try:
+                prompt, _ = await read_until(reader, (USER_PROMPT, PASSWORD_PROMPT), timeout)
+            except asyncio.TimeoutError:
+                raise LoginError("нет приглашения к вводу логина")
+
+        if prompt == 0:
+            writer.write(username + "\n")
+            try:
+                await read_until(reader, (PASSWORD_PROMPT,), timeout)
+            except asyncio.TimeoutError:
+                raise LoginError("нет приглашения к вводу пароля")
+    except ConnectionResetError as e:
+        raise ConnectionRefusedError(f"сессия закрыта до ввода пароля: {e}") from e
     writer.write(password + "\n")
-    await asyncio.sleep(0.5)
 
-    return reader, writer
+    # баннер после входа может содержать "denied" и т.п. - отказом считается
+    # только повторное приглашение или сообщение об ошибке последней строкой
+    idx, text = await read_until(
+        reader, (SHELL_PROMPT, USER_PROMPT, PASSWORD_PROMPT), timeout, partial=True
+    )
+    if idx == 0:
+        return True, None
+    if idx == 1:
+        return False, 0
+    if idx == 2:
+        return False, 1
+
+    lines = ANSI.sub("", text).strip().splitlines()
+    if lines and LOGIN_FAILED.search(lines[-1]):
+        return False, None
+    # приглашение CLI не распознано, но и отказа не было
+    return True, None
+
+
+async def open_session(host, credentials, timeout=5.0, port=23, connect_minwait=0.05):
+    """
+    Подключается и авторизуется, перебирая учетные данные.
+    connect_minwait - минимальное ожидание telnet-согласования в telnetlib3
+    (по умолчанию библиотека ждет 2с); приглашения логина ждет read_until.
+    """
+    last = _working_credentials.get(host)
+    ordered = sorted(credentials, key=lambda c: c != last)
+
+    reader = writer = None
+    prompt = None
+    try:
+        for username, password in ordered:
+            if writer is None:
+                reader, writer = await telnetlib3.open_connection(
+                    host=host, port=port, connect_minwait=connect_minwait
+                )
+                prompt = None
+            try:
+                ok, prompt = await login(reader, writer, username, password, timeout, prompt)
+                if ok:
+                    _working_credentials[host] = (username, password)
+                    return reader, writer
+            except ConnectionResetError:
+                # коммутатор закрыл сессию после отказа в пароле - пробуем заново;
+                # разрыв до пароля login поднимает как ConnectionRefusedError
+                writer.close()
+                writer = None
+    except BaseException:
+        if writer is not None:
+            writer.close()
+        raise
+
+    if writer is not None:
+        writer.close()
+    _working_credentials.pop(host, None)
+    raise LoginError(f"{host}: авторизация не удалась, перебрано учетных записей: {len(ordered)}")
+
+
+class TelnetTransport(transport.Transport):
+    name = "telnet"
+
+    def __init__(self, port=23, login_timeout=5.0, connect_minwait=0.05):
+        self.port = port
+        self.login_timeout = login_timeout
+        self.connect_minwait = connect_minwait
+
+    async def open(self, host, credentials):
+        return await open_session(
+            host, credentials, self.login_timeout, self.port, self.connect_minwait
+        )
+
+
+transport.register("telnet", TelnetTransport)
+
+
+async def telnet_connect(host: str, password):
+    """
+    Создает сессию с коммутатором и возвращает reader, writer.
+    Транспорт (telnet или ssh) выбирается по хосту, см. core.transport.
+    password - строка (логин admin) или список пар (логин, пароль).
+    """
+    credentials = normalize_credentials(password)
+    scheduler = get_scheduler()
+    # очередь и подключение ограничены бюджетом диагностики, если он задан
+    await budget.limit(scheduler.acquire(host))
+    pool = get_pool()
+    try:
+        session = await pool.checkout(host, credentials) if pool else None
+        if session:
+            reader, writer = session
+        else:
+            reader, writer = await budget.limit(
+                transport.get_transport(host).open(host, credentials)
+            )
+    except BaseException:
+        scheduler.release(host)
+        raise
+
+    on_close = None
+    if pool:
+        on_close = lambda raw: pool.checkin(host, credentials, reader, raw)
+    return reader, ScheduledWriter(writer, scheduler, host, on_close=on_close)
+
+
+async def send_command(reader, writer, command, timeout=1.2, stop=None):
+    """
+    Отправка команды и получение вывода с обработкой 'more'.
+    stop(output) -> True прекращает листание страниц (уже известные данные).
+    Если истек бюджет диагностики - BudgetExceeded, сессия не возвращается в пул.
+    """
+    try:
+        budget.clamp(timeout)
+        await pace_command(writer)
+        writer.write(command + "\n")
+        await asyncio.sleep(0.3)
+        return await _read_output(reader, writer, timeout, stop)
+    except budget.BudgetExceeded:
+        discard_session(writer)
+        raise
+
+
+def discard_session(writer):
+    """Прерванная команда оставила сессию в неизвестном состоянии - не в пул"""
+    discard = getattr(writer, "discard", None)
+    if discard:
+        discard()
 
 
-async def send_command(reader, writer, command, timeout=1.2):
-    """Отправка команды и получение вывода с обработкой 'more'"""
-    writer.write(command + "\n")
-    await asyncio.sleep(0.3)
+async def _read_output(reader, writer, timeout, stop):
     output = ""
+    stopped = False
 
     while True:
         try:
-            chunk = await asyncio.wait_for(reader.read(2048), timeout=timeout)
+            chunk = await budget.read(reader, 2048, timeout, done=lambda: at_prompt(output))
             if not chunk:
                 break
 
             output += chunk
 
             if "---- More ----" in chunk or "more" in chunk.lower():
-                writer.write(" ")
+                if stop and not stopped and stop(output):
+                    writer.write("q")
+                    stopped = True
+                elif not stopped:
+                    writer.write(" ")
                 await asyncio.sleep(0.2)
 
         except asyncio.TimeoutError:
             break
 
-    return output
\ No newline at end of file
+    return output
@@ -0,0 +1,72 @@
+import abc
+import importlib
+
+# ================== TRANSPORTS ==================
+class Transport(abc.ABC):
+    """
+    Способ доставки CLI-сессии к коммутатору. open() возвращает пару
+    reader/writer с интерфейсом telnetlib3: await reader.read(n) -> str,
+    writer.write(str), writer.close().
+    """
+
+    name = "base"
+
+    @abc.abstractmethod
+    async def open(self, host: str, credentials):
+        """Открывает авторизованную CLI-сессию, возвращает (reader, writer)"""
+
+    def close(self):
+        """Закрывает соединения, которые транспорт держит между сессиями"""
+
+
+# имя -> модуль, который регистрирует транспорт при импорте
+_LAZY = {
+    "telnet": "core.telnet_common",
+    "ssh": "core.ssh_transport",
+}
+_factories = {}
+_instances = {}
+
+_default = "telnet"
+_per_host = {}
+
+
+def register(name: str, factory):
+    _factories[name] = factory
+
+
+def configure(default="telnet", per_host=None, options=None):
+    """
+    default - транспорт по умолчанию, per_host - {host: имя транспорта},
+    options - {имя: kwargs конструктора} (например порт SSH).
+    """
+    global _default
+    close_all()
+    _default = default
+    _per_host.clear()
+    _per_host.update(per_host or {})
+    for name, kwargs in (options or {}).items():
+        _instances[name] = _create(name, **kwargs)
+
+
+def _create(name, **kwargs):
+    if name not in _factories:
+        module = _LAZY.get(name)
+        if module is None:
+            raise ValueError(f"неизвестный транспорт: {name}")
+        importlib.import_module(module)
+    return _factories[name](**kwargs)
+
+
+def get_transport(host: str) -> Transport:
+    name = _per_host.get(host, _default)
+    transport = _instances.get(name)
+    if transport is None:
+        transport = _instances[name] = _create(name)
+    return transport
+
+
+def close_all():
+    for transport in _instances.values():
+        transport.close()
+    _instances.clear()
@@ -0,0 +1,149 @@
+import asyncio
+import re
+import time
+
+from core.log_store import get_log_store
+from core.scheduler import pace_command
+from core.telnet_common import telnet_connect, clean_line, LoginError
+
+SYSLOG_PRI = re.compile(r"^<\d+>")
+
+# одна строка может прийти и из terminal monitor, и по syslog: повтор из
+# другого источника в пределах окна - дубль, из того же - новое событие
+DUPLICATE_WINDOW = 2.0
+_recent = {}
+
+
+class LineSplitter:
+    """Собирает строки из произвольно нарезанных кусков потока"""
+
+    def __init__(self):
+        self._tail = ""
+
+    def feed(self, chunk: str):
+        data = self._tail + chunk.replace("\r", "\n")
+        *lines, self._tail = data.split("\n")
+        return [line for line in lines if line.strip()]
+
+
+def is_duplicate(host, text, source, now):
+    """Та же строка хоста из другого источника в пределах DUPLICATE_WINDOW"""
+    for key, (seen, _) in list(_recent.items()):
+        if now - seen > DUPLICATE_WINDOW:
+            del _recent[key]
+    previous = _recent.pop((host, text), None)
+    if previous is not None and previous[1] != source:
+        return True
+    _recent[(host, text)] = (now, source)
+    return False
+
+
+def emit(queue, host, module, line, ports=None, source="monitor"):
+    """Разбирает строку лога и ставит в очередь новое событие UP/DOWN"""
+    event = module.parse_log_line(clean_line(line))
+    if event is None or event.state not in ("UP", "DOWN"):
+        return
+    if ports and event.port not in ports:
+        return
+    now = time.time()
+    if is_duplicate(host, event.text, source, now):
+        return
+    # D-Link syslog и т.п.: строка без номера и времени повторяется дословно
+    # при каждом флапе - это новое событие, в локальном логе его отличает
+    # время приема
+    anonymous = event.log_id is None and not event.timestamp
+    if anonymous:
+        received = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
+        event = event._replace(timestamp=f"{received}.{int(now * 1000) % 1000:03d}")
+    # локальный лог отсеивает уже сохраненные записи и пишет событие в историю
+    if get_log_store().device(host).add([event]) or anonymous:
+        queue.put_nowait((now, host, event))
+
+
+# ================== TELNET MONITOR ==================
+async def tail_session(host, password, module, queue, ports=None,
+                       keepalive=60.0, retry=5.0):
+    """
+    Держит одну сессию с включенным terminal monitor и разбирает
+    события по мере их появления. При обрыве переподключается.
+    """
+    while True:
+        writer = None
+        try:
+            reader, writer = await telnet_connect(host, password)
+            for command in module.MONITOR_COMMANDS:
+                await pace_command(writer)
+                writer.write(command + "\n")
+
+            splitter = LineSplitter()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(reader.read(4096), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    # пустая строка не дает коммутатору закрыть сессию по простою
+                    writer.write("\n")
+                    continue
+                if not chunk:
+                    break
+                for line in splitter.feed(chunk):
+                    emit(queue, host, module, line, ports)
+        except LoginError as e:
+            print(f"❌ {host}: {e}, наблюдение за коммутатором остановлено")
+            return
+        except (OSError, asyncio.TimeoutError) as e:
+            print(f"⚠ {host}: {e or type(e).__name__}, переподключение через {retry:g}с")
+        except Exception as e:
+            print(f"⚠ {host}: ошибка {type(e).__name__}: {e}, переподключение через {retry:g}с")
+        finally:
+            if writer is not None:
+                writer.close()
+        await asyncio.sleep(retry)
+
+
+# ================== SYSLOG ==================
+class SyslogProtocol(asyncio.DatagramProtocol):
+    """
+    Прием syslog по UDP. Строка разбирается парсером вендора хоста-отправителя,
+    для неизвестных отправителей пробуются все парсеры.
+    """
+
+    def __init__(self, queue, modules_by_host, all_modules, ports=None):
+        self.queue = queue
+        self.modules_by_host = modules_by_host
+        self.all_modules = all_modules
+        self.ports = ports
+
+    def datagram_received(self, data, addr):
+        host = addr[0]
+        line = SYSLOG_PRI.sub("", data.decode("utf-8", errors="replace")).strip()
+        module = self.modules_by_host.get(host)
+        if module is not None:
+            emit(self.queue, host, module, line, self.ports, source="syslog")
+            return
+        for module in self.all_modules:
+            if module.parse_log_line(clean_line(line)) is not None:
+                emit(self.queue, host, module, line, self.ports, source="syslog")
+                return
+
+
+async def start_syslog(queue, modules_by_host, all_modules, ports=None,
+                       bind="0.0.0.0", port=514):
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: SyslogProtocol(queue, modules_by_host, all_modules, ports),
+        local_addr=(bind, port),
+    )
+    return transport
+
+
+# ================== OUTPUT ==================
+def format_event(received, host, event):
+    mark = "🔴" if event.state == "DOWN" else "🟢"
+    when = time.strftime("%H:%M:%S", time.localtime(received))
+    return f"{when} {mark} {host:<15} port {event.port:<8} {event.state:<4} | {event.text}"
+
+
+async def print_events(queue):
+    while True:
+        received, host, event = await queue.get()
+        print(format_event(received, host, event), flush=True)
@@ -1,5 +1,11 @@
-import sys, asyncio
+import os, sys, time, asyncio, argparse, secrets
+from core import scheduler, transport, history, plan
+from core.budget import deadline, section, current, parse_budget
+from core.credentials import load_credentials, ENV_VAR
 from core.detect_vendor import detect_vendor
+from core.inventory import load_inventory
+from core.output import capture
+from core.telnet_common import LoginError
 from vendors import eltex_diag, zte_diag, snr_diag, dlink_diag
 
 VENDOR_MODULES = {
@@ -9,24 +15,515 @@ VENDOR_MODULES = {
     "D-LINK": dlink_diag,
 }
 
-async def main():
-    if len(sys.argv) != 3:
-        print("Использование: python3 main.py <IP> <PORT>")
+def add_common_args(parser):
+    parser.add_argument("--credentials",
+                        help="файл со строками логин:пароль, пробуются по порядку")
+    parser.add_argument("--transport", choices=("telnet", "ssh"), default="telnet",
+                        help="протокол доступа к коммутатору")
+    parser.add_argument("--ssh-port", type=int, default=22)
+    parser.add_argument("--known-hosts",
+                        help="файл ключей SSH-коммутаторов в дополнение к ~/.ssh/known_hosts")
+    parser.add_argument("--ssh-accept-new", action="store_true",
+                        help="принимать ключи новых коммутаторов и дописывать их в --known-hosts")
+    parser.add_argument("--no-history", action="store_true",
+                        help="не записывать результаты в SQLite-историю")
+    add_scheduler_args(parser)
+
+def add_budget_arg(parser):
+    parser.add_argument("--budget", type=parse_budget,
+                        help="срок одной диагностики, например 5s; по истечении - частичный отчет")
+
+def add_scheduler_args(parser):
+    parser.add_argument("--max-sessions", type=int, default=32,
+                        help="общий лимит одновременных сессий")
+    parser.add_argument("--per-host", type=int, default=2,
+                        help="лимит одновременных сессий на коммутатор")
+    parser.add_argument("--rate", type=float, default=5.0,
+                        help="команд в секунду на коммутатор (0 - без лимита)")
+
+def configure_scheduler(args):
+    scheduler.configure(
+        max_sessions=args.max_sessions,
+        per_host=args.per_host,
+        per_host_rate=args.rate,
+    )
+
+def configure_transport(args):
+    options = None
+    if args.transport == "ssh":
+        options = {"ssh": {"port": args.ssh_port, "host_keys": args.known_hosts,
+                           "accept_new": args.ssh_accept_new}}
+    transport.configure(default=args.transport, options=options)
+
+def require_credentials(args):
+    """Учетные данные или выход с подсказкой, если их нет"""
+    try:
+        return load_credentials(args.credentials)
+    except ValueError as e:
+        print(f"❌ {e}: укажите --credentials или {ENV_VAR}")
+        sys.exit(2)
+
+def setup(args):
+    """Общая настройка режимов; возвращает учетные данные"""
+    configure_scheduler(args)
+    configure_transport(args)
+    if not args.no_history:
+        history.enable()
+    return require_credentials(args)
+
+def teardown():
+    transport.close_all()
+    history.close()
+    plan.save_sizes()
+
+async def diagnose(host, port, password, vendor=None, budget=None):
+    """
+    Определяет вендора (если не передан) и запускает его диагностику.
+    budget - срок в секундах: по истечении команды прерываются, отчет
+    выводится без недостающих разделов.
+    Возвращает (vendor, PortCounters или None).
+    """
+    with deadline(budget):
+        if vendor is None:
+            with section("VENDOR", critical=True, report=False):
+                vendor = await detect_vendor(host, password)
+            if vendor is None:
+                print(f"⏱ {host}: вендор не определен за отведенное время")
+                return None, None
+        print("ОПРЕДЕЛЕНО:", vendor)
+
+        counters = None
+        if vendor in VENDOR_MODULES:
+            module = VENDOR_MODULES[vendor]
+            counters = await module.run(host, password, port)
+            history.record_counters(counters)
+        else:
+            print(f"❌ Устройство {host} не поддерживается или не определено.")
+
+        spent = current()
+        if spent is not None and spent.missing:
+            print(f"\n⏱ Частичный результат (бюджет {spent.seconds:g}с), "
+                  f"нет разделов: {', '.join(spent.missing)}")
+    return vendor, counters
+
+async def collect_counters(targets, password, budget=None):
+    """Фоновый сбор счетчиков по списку (host, port), отчеты не печатаются"""
+    async def one(host, port):
+        with scheduler.priority(scheduler.BACKGROUND), capture():
+            try:
+                _, counters = await diagnose(host, port, password, budget=budget)
+                return counters
+            except Exception as e:
+                failed.append((host, port, str(e) or type(e).__name__))
+
+    failed = []
+    results = await asyncio.gather(*(one(h, p) for h, p in targets))
+    return [c for c in results if c is not None], failed
+
+# ================== MODES ==================
+async def diag_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="main.py",
+        usage="python3 main.py <IP> <PORT> [опции]",
+    )
+    parser.add_argument("host")
+    parser.add_argument("port")
+    add_common_args(parser)
+    add_budget_arg(parser)
+    parser.add_argument("--stats", action="store_true",
+                        help="показать время ожидания в очереди планировщика")
+    args = parser.parse_args(argv)
+    credentials = setup(args)
+
+    try:
+        await diagnose(args.host, args.port, credentials, budget=args.budget)
+    except LoginError as e:
+        print(f"❌ Ошибка авторизации: {e}")
+        sys.exit(2)
+    except ConnectionRefusedError as e:
+        print(f"❌ {args.host}: коммутатор не принял сессию: {e}")
+        sys.exit(2)
+    finally:
+        teardown()
+
+    if args.stats:
+        print("\n" + scheduler.get_scheduler().report())
+
+async def serve_main(argv):
+    from core.service import DiagService
+    from core.sweep import is_loopback
+
+    parser = argparse.ArgumentParser(prog="main.py serve")
+    parser.add_argument("--listen", default="127.0.0.1", help="адрес HTTP")
+    parser.add_argument("--http-port", type=int, default=8080)
+    parser.add_argument("--unix", help="путь к Unix-сокету вместо TCP")
+    parser.add_argument("--session-ttl", type=float, default=60.0,
+                        help="сколько держать простаивающую сессию, с")
+    parser.add_argument("--token", default=os.environ.get("DIAG_TOKEN"),
+                        help="ключ клиентов, 'Authorization: Bearer <token>' (или DIAG_TOKEN)")
+    add_common_args(parser)
+    add_budget_arg(parser)
+    args = parser.parse_args(argv)
+    if not args.token and not args.unix and not is_loopback(args.listen):
+        print(f"❌ --listen {args.listen}: для удаленных клиентов задайте --token (или DIAG_TOKEN)")
+        sys.exit(2)
+    credentials = setup(args)
+
+    service = DiagService(diagnose, credentials, session_ttl=args.session_ttl, budget=args.budget,
+                          token=args.token)
+    try:
+        await service.serve(args.listen, args.http_port, unix_path=args.unix)
+    finally:
+        teardown()
+
+async def health_main(argv):
+    from core import health
+
+    parser = argparse.ArgumentParser(prog="main.py health")
+    parser.add_argument("inventory", help="файл со строками 'IP PORT [PORT ...]'")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--no-save", action="store_true",
+                        help="не обновлять снимок для расчета прироста")
+    add_common_args(parser)
+    add_budget_arg(parser)
+    args = parser.parse_args(argv)
+    credentials = setup(args)
+
+    try:
+        counters, failed = await collect_counters(
+            load_inventory(args.inventory), credentials, budget=args.budget
+        )
+    finally:
+        teardown()
+
+    previous = health.load_snapshot()
+    print(health.format_ranking(health.rank(counters, previous, top=args.top)))
+    if failed:
+        print(f"\n⚠ Недоступно: {len(failed)}")
+        for host, port, error in failed:
+            print(f"  {host} {port}: {error}")
+    if counters and not args.no_save:
+        health.save_snapshot(counters)
+
+def format_ts(ts):
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(ts))
+
+async def history_main(argv):
+    parser = argparse.ArgumentParser(prog="main.py history")
+    parser.add_argument("host")
+    parser.add_argument("port")
+    parser.add_argument("--days", type=float, default=7)
+    args = parser.parse_args(argv)
+
+    conn = history.connect()
+    rows = history.port_history(conn, args.host, args.port, time.time() - args.days * 86400)
+    conn.close()
+
+    print(f"===== HISTORY {args.host} PORT {args.port} ({args.days:g} дн.) =====")
+    if not rows:
+        print("Нет данных")
+        return
+    print(f"{'TIME':<18}{'STATE':<7}{'SPEED':<10}{'IN ERR':>10}{'OUT ERR':>10}{'CRC':>10}")
+    for ts, state, speed, in_err, out_err, crc, _, _ in rows:
+        print(f"{format_ts(ts):<18}{state:<7}{speed or '':<10}{in_err:>10}{out_err:>10}{crc:>10}")
+
+    crc_values = [r[5] for r in rows]
+    growing = sum(b > a for a, b in zip(crc_values, crc_values[1:]))
+    print(f"\nCRC: {crc_values[0]} -> {crc_values[-1]}, рост в {growing} из {len(rows) - 1} интервалов")
+
+async def top_growth_main(argv):
+    parser = argparse.ArgumentParser(prog="main.py top-growth")
+    parser.add_argument("--days", type=float, default=7)
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    conn = history.connect()
+    rows = history.top_error_growth(conn, time.time() - args.days * 86400, args.top)
+    conn.close()
+
+    print(f"===== TOP ERROR GROWTH ({args.days:g} дн.) =====")
+    print(f"{'HOST':<16}{'PORT':<10}{'SAMPLES':>8}{'ERR +':>10}{'CRC +':>10}  {'FROM':<17}{'TO':<17}")
+    for host, port, samples, growth, crc_growth, t0, t1 in rows:
+        print(f"{host:<16}{port:<10}{samples:>8}{growth:>10}{crc_growth:>10}  {format_ts(t0):<17}{format_ts(t1):<17}")
+
+async def watch_main(argv):
+    from core import watch
+
+    parser = argparse.ArgumentParser(prog="main.py watch")
+    parser.add_argument("hosts", nargs="+")
+    parser.add_argument("--ports", help="только эти порты, как в логе коммутатора (через запятую)")
+    parser.add_argument("--syslog", action="store_true",
+                        help="принимать события по syslog (UDP)")
+    parser.add_argument("--syslog-bind", default="0.0.0.0")
+    parser.add_argument("--syslog-port", type=int, default=514)
+    parser.add_argument("--no-monitor", action="store_true",
+                        help="не держать сессии terminal monitor, только syslog")
+    add_common_args(parser)
+    args = parser.parse_args(argv)
+    credentials = setup(args)
+    ports = set(args.ports.split(",")) if args.ports else None
+
+    queue = asyncio.Queue()
+    tasks = []
+    syslog = None
+    try:
+        vendors = await asyncio.gather(
+            *(detect_vendor(h, credentials) for h in args.hosts), return_exceptions=True
+        )
+        modules_by_host = {}
+        monitored = []
+        for host, vendor in zip(args.hosts, vendors):
+            if isinstance(vendor, Exception):
+                print(f"❌ {host}: {vendor or type(vendor).__name__}")
+                continue
+            module = VENDOR_MODULES.get(vendor)
+            if module is None:
+                print(f"❌ {host}: устройство не поддерживается ({vendor})")
+                continue
+            modules_by_host[host] = module
+            if args.no_monitor:
+                continue
+            if module.MONITOR_COMMANDS:
+                monitored.append(host)
+            elif not args.syslog:
+                print(f"⚠ {host} ({vendor}) не выводит лог в сессию - используйте --syslog")
+
+        # сессия monitor занимает слот планировщика, пока идет наблюдение:
+        # при лимите меньше числа хостов лишние ждали бы слота вечно
+        if len(monitored) > args.max_sessions:
+            print(f"⚠ --max-sessions {args.max_sessions} меньше числа коммутаторов "
+                  f"с monitor ({len(monitored)}), лимит поднят до {len(monitored)}")
+            scheduler.configure(max_sessions=len(monitored), per_host=args.per_host,
+                                per_host_rate=args.rate)
+        for host in monitored:
+            tasks.append(asyncio.create_task(
+                watch.tail_session(host, credentials, modules_by_host[host], queue, ports)
+            ))
+
+        if args.syslog:
+            syslog = await watch.start_syslog(
+                queue, modules_by_host, list(VENDOR_MODULES.values()), ports,
+                bind=args.syslog_bind, port=args.syslog_port,
+            )
+            print(f"Syslog: udp {args.syslog_bind}:{args.syslog_port}")
+        if not tasks and not args.syslog:
+            return
+
+        print(f"Наблюдение за {len(modules_by_host)} коммутаторами, Ctrl+C - выход")
+        await watch.print_events(queue)
+    finally:
+        for task in tasks:
+            task.cancel()
+        if syslog is not None:
+            syslog.close()
+        teardown()
+
+async def crawl_main(argv):
+    from core.crawl import crawl, allowed_addresses
+    from core.records import mac_to_int, format_mac
+
+    parser = argparse.ArgumentParser(prog="main.py crawl")
+    parser.add_argument("start", help="IP коммутатора, с которого начинается поиск")
+    parser.add_argument("mac")
+    parser.add_argument("--max-depth", type=int, default=8)
+    parser.add_argument("--parallel", type=int, default=8,
+                        help="одновременно опрашиваемых коммутаторов")
+    parser.add_argument("--allow", action="append", default=[],
+                        help="подсеть управления, в которой можно опрашивать соседей "
+                             "(через запятую или несколько раз)")
+    parser.add_argument("--inventory",
+                        help="файл инвентаря: соседи с этими адресами тоже опрашиваются")
+    add_common_args(parser)
+    args = parser.parse_args(argv)
+    try:
+        mac = mac_to_int(args.mac)
+    except ValueError:
+        print(f"❌ Некорректный MAC: {args.mac}")
         sys.exit(1)
+    try:
+        networks = [n for value in args.allow for n in value.split(",") if n.strip()]
+        hosts = {host for host, _ in load_inventory(args.inventory)} if args.inventory else ()
+        allowed = allowed_addresses(networks, hosts)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    if not networks and not hosts:
+        print("⚠ Не заданы --allow и --inventory: соседи по LLDP опрашиваться не будут")
+    credentials = setup(args)
+
+    started = time.monotonic()
+    try:
+        result = await crawl(args.start, mac, credentials, VENDOR_MODULES,
+                             max_depth=args.max_depth, parallel=args.parallel,
+                             allowed=allowed)
+    finally:
+        teardown()
 
-    host = sys.argv[1]
-    port = sys.argv[2]
+    print(f"===== CRAWL {format_mac(mac, sep=':')} =====")
+    for hop in result.path:
+        port = hop.entry.port if hop.entry else "-"
+        where = f"-> {hop.neighbor.address or hop.neighbor.name}" if hop.neighbor else "порт доступа"
+        print(f"{hop.host:<16}{hop.vendor:<8}port {port:<12}{where}")
+    if result.found:
+        last = result.path[-1]
+        print(f"\n✅ MAC на {last.host} порт {last.entry.port} (VLAN {last.entry.vlan})")
+    elif result.path:
+        print("\n⚠ Порт доступа не найден, показан последний известный участок пути")
+    else:
+        print("\n❌ MAC не найден")
+    print(f"Опрошено коммутаторов: {result.visited}, время: {time.monotonic() - started:.1f}с")
+    for host, error in result.errors.items():
+        print(f"  ⚠ {host}: {error}")
+
+def format_result(record, done, total):
+    c = record.get("counters")
+    if c:
+        line = (f"{c['state']:<5} {c['speed']:<9} in_err {c['in_errors']} "
+                f"out_err {c['out_errors']} crc {c['crc']}")
+    else:
+        line = f"❌ {record.get('error')}"
+    return f"[{done}/{total}] {record['host']:<16}{record['port']:<10}{line}"
 
-    password = "asdzx1390"
+async def sweep_main(argv):
+    from core import health
+    from core.sweep import Coordinator, spawn_workers, is_loopback
+    from core.paths import data_path
 
-    vendor = await detect_vendor(host, password)
-    print("ОПРЕДЕЛЕНО:", vendor)
+    parser = argparse.ArgumentParser(prog="main.py sweep")
+    parser.add_argument("inventory", help="файл со строками 'IP PORT [PORT ...]'")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2,
+                        help="локальных процессов-воркеров (0 - только удаленные)")
+    parser.add_argument("--concurrency", type=int, default=16,
+                        help="коммутаторов одновременно на воркер")
+    parser.add_argument("--listen", default="127.0.0.1",
+                        help="адрес для воркеров (0.0.0.0 - принимать с других машин)")
+    parser.add_argument("--listen-port", type=int, default=0)
+    parser.add_argument("--token", default=os.environ.get("SWEEP_TOKEN"),
+                        help="общий ключ для удаленных воркеров (или SWEEP_TOKEN)")
+    parser.add_argument("--checkpoint", default=data_path("sweep_checkpoint.jsonl"))
+    parser.add_argument("--resume", action="store_true",
+                        help="продолжить прерванный обход по checkpoint")
+    parser.add_argument("--steal-after", type=float, default=30.0,
+                        help="через сколько секунд отдать медленный коммутатор еще одному воркеру")
+    parser.add_argument("--top", type=int, default=20)
+    add_common_args(parser)
+    add_budget_arg(parser)
+    args = parser.parse_args(argv)
+    if not args.token and not is_loopback(args.listen):
+        print(f"❌ --listen {args.listen}: для удаленных воркеров задайте --token (или SWEEP_TOKEN)")
+        sys.exit(2)
+    # локальные воркеры читают те же учетные данные - проверяем до их запуска,
+    # иначе каждый воркер завершился бы с ошибкой, а координатор ждал бы вечно
+    if args.workers:
+        require_credentials(args)
+    # локальные воркеры авторизуются всегда: без --token ключ одноразовый
+    token = args.token or secrets.token_hex(16)
+
+    coordinator = Coordinator(
+        load_inventory(args.inventory),
+        checkpoint=args.checkpoint,
+        resume=args.resume,
+        steal_after=args.steal_after,
+        token=token,
+        on_result=lambda record, done, total: print(format_result(record, done, total), flush=True),
+    )
+    if args.resume and coordinator.results:
+        print(f"Из checkpoint: {len(coordinator.results)} из {coordinator.total}")
+
+    # воркеры получают те же настройки доступа, что и координатор
+    worker_args = ["--concurrency", str(args.concurrency),
+                   "--transport", args.transport, "--ssh-port", str(args.ssh_port),
+                   "--max-sessions", str(args.max_sessions), "--per-host", str(args.per_host),
+                   "--rate", str(args.rate)]
+    for flag, value in (("--credentials", args.credentials), ("--budget", args.budget),
+                        ("--known-hosts", args.known_hosts)):
+        if value is not None:
+            worker_args += [flag, str(value)]
+    for flag in ("no_history", "ssh_accept_new"):
+        if getattr(args, flag):
+            worker_args.append("--" + flag.replace("_", "-"))
+
+    started = time.monotonic()
+    server, address = await coordinator.serve(args.listen, args.listen_port)
+    processes = []
+    try:
+        print(f"Координатор: {address}, целей: {coordinator.total}")
+        # ключ передается локальным воркерам через окружение, не в argv
+        os.environ["SWEEP_TOKEN"] = token
+        processes = await spawn_workers(args.workers, address, worker_args)
+        completed = await coordinator.wait_finished(processes)
+        if completed:
+            await coordinator.drain_workers()
+    finally:
+        server.close()
+        coordinator.close()
+        for process in processes:
+            if process.returncode is None:
+                process.terminate()
+            await process.wait()
+
+    if not completed:
+        codes = ", ".join(str(p.returncode) for p in processes)
+        print(f"\n❌ Все воркеры завершились (коды: {codes}), опрошено "
+              f"{len(coordinator.results)} из {coordinator.total}; продолжить: --resume")
+        sys.exit(1)
+
+    counters = coordinator.counters()
+    failed = [r for r in coordinator.results.values() if not r.get("counters")]
+    print("\n" + health.format_ranking(health.rank(counters, health.load_snapshot(), top=args.top)))
+    print(f"\nОбход: {len(coordinator.results)} портов, ошибок {len(failed)}, "
+          f"{time.monotonic() - started:.1f}с")
+
+async def worker_main(argv):
+    from core.sweep import run_worker
+
+    parser = argparse.ArgumentParser(prog="main.py worker")
+    parser.add_argument("--connect", required=True, help="адрес координатора HOST:PORT")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--token", default=os.environ.get("SWEEP_TOKEN"))
+    add_common_args(parser)
+    add_budget_arg(parser)
+    args = parser.parse_args(argv)
+    credentials = setup(args)
+
+    try:
+        await run_worker(args.connect, credentials, diagnose, concurrency=args.concurrency,
+                         token=args.token, budget=args.budget)
+    except PermissionError as e:
+        print(f"❌ {e}: проверьте --token (или SWEEP_TOKEN)")
+        sys.exit(2)
+    finally:
+        teardown()
+
+MODES = {
+    "serve": serve_main,
+    "health": health_main,
+    "history": history_main,
+    "top-growth": top_growth_main,
+    "watch": watch_main,
+    "crawl": crawl_main,
+    "sweep": sweep_main,
+    "worker": worker_main,
+}
+
+async def main():
+    if len(sys.argv) < 2 or (len(sys.argv) < 3 and sys.argv[1] not in MODES):
+        print("Использование: python3 main.py <IP> <PORT> [--budget 5s]")
+        print("               python3 main.py serve [--http-port 8080 | --unix PATH]")
+        print("               python3 main.py health INVENTORY [--top 20]")
+        print("               python3 main.py history <IP> <PORT> [--days 7]")
+        print("               python3 main.py top-growth [--days 7] [--top 20]")
+        print("               python3 main.py watch <IP> [<IP> ...] [--syslog]")
+        print("               python3 main.py crawl <IP> <MAC> [--max-depth 8]")
+        print("               python3 main.py sweep INVENTORY [--workers N] [--resume]")
+        print("               python3 main.py worker --connect HOST:PORT")
+        sys.exit(1)
 
-    if vendor in VENDOR_MODULES:
-        module = VENDOR_MODULES[vendor]
-        await module.run(host, password, port)
+    mode = MODES.get(sys.argv[1])
+    if mode:
+        await mode(sys.argv[2:])
     else:
-        print(f"❌ Устройство {host} не поддерживается или не определено.")
+        await diag_main(sys.argv[1:])
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -1,6 +1,13 @@
 # dlink_diag.py
 import asyncio, re
-from core.telnet_common import telnet_connect
+from core.telnet_common import telnet_connect, discard_session, at_prompt
+from core.scheduler import pace_command
+from core.records import MacEntry, PortCounters, mac_to_int, format_mac
+from core.log_store import get_log_store, event_from_line
+from core import history
+from core.lldp import parse_lldp_detail
+from core import budget
+from core.budget import section, MISSING
 
 # ================== ANSI CLEAN ==================
 ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
@@ -18,9 +25,11 @@ def extract_speed(port_info_line):
     return None
 
 # ================== TELNET COMMANDS ==================
-async def get_telnet_output(host, password, command):
+async def get_telnet_output(host, password, command, page_all=False):
+    """page_all=False - только первая страница (как раньше), True - листать до конца"""
     reader, writer = await telnet_connect(host, password)
 
+    await pace_command(writer)
     writer.write(f"{command}\n")
     await asyncio.sleep(0.5)
 
@@ -29,7 +38,9 @@ async def get_telnet_output(host, password, command):
 
     while True:
         try:
-            chunk = await asyncio.wait_for(reader.read(4096), timeout=5.0)
+            chunk = await budget.read(
+                reader, 4096, 5.0, done=lambda: bool(output_lines) and at_prompt(output_lines[-1])
+            )
             if not chunk:
                 break
 
@@ -40,7 +51,12 @@ async def get_telnet_output(host, password, command):
                     output_lines.append(cleaned)
 
             more_markers = ["----", "Next Page", "Press any key", "SPACE", "CTRL+C"]
-            if any(marker in chunk for marker in more_markers) and not more_triggered:
+            if page_all:
+                # разделители '----' есть в самом выводе, листаем только по приглашению
+                if any(marker in chunk for marker in ["Next Page", "SPACE"]):
+                    writer.write(" ")
+                    await asyncio.sleep(0.2)
+            elif any(marker in chunk for marker in more_markers) and not more_triggered:
                 writer.write("q")
                 await asyncio.sleep(0.2)
                 more_triggered = True
@@ -50,6 +66,10 @@ async def get_telnet_output(host, password, command):
 
         except asyncio.TimeoutError:
             break
+        except budget.BudgetExceeded:
+            discard_session(writer)
+            writer.close()
+            raise
 
     writer.close()
     await asyncio.sleep(0.2)
@@ -73,9 +93,8 @@ async def show_ports_speed(host, password, port):
     full_port_info = " ".join(port_data)
     return extract_speed(full_port_info)
 
-async def get_port_macs(host, password, port):
-    lines = await get_telnet_output(host, password, f"show fdb port {port}")
-
+def parse_fdb(lines, port=None):
+    """Строки show fdb: VID, имя VLAN, MAC, порт, тип"""
     mac_table = []
     mac_regex = re.compile(r'([0-9A-Fa-f]{2}-){5}[0-9A-Fa-f]{2}')
 
@@ -87,13 +106,22 @@ async def get_port_macs(host, password, port):
         mac_candidate = cols[2]
 
         if vid_candidate.isdigit() and mac_regex.fullmatch(mac_candidate):
-            mac_table.append({'vid': vid_candidate, 'mac': mac_candidate})
+            mac_table.append(MacEntry(
+                mac=mac_to_int(mac_candidate),
+                vlan=int(vid_candidate),
+                port=str(port) if port is not None else cols[3]
+            ))
     return mac_table
 
+async def get_port_macs(host, password, port):
+    lines = await get_telnet_output(host, password, f"show fdb port {port}")
+    return parse_fdb(lines, port)
+
 async def get_port_bytes(host, password, port):
     async def run_telnet_raw():
         reader, writer = await telnet_connect(host, password)
 
+        await pace_command(writer)
         writer.write(f"show packet ports {port}\n")
         await asyncio.sleep(0.3)
         writer.write("q")
@@ -104,7 +132,9 @@ async def get_port_bytes(host, password, port):
         output_chunks = []
         while True:
             try:
-                chunk = await asyncio.wait_for(reader.read(4096), timeout=1.0)
+                chunk = await budget.read(
+                    reader, 4096, 1.0, done=lambda: bool(output_chunks) and at_prompt(output_chunks[-1])
+                )
                 if not chunk:
                     break
                 output_chunks.append(chunk)
@@ -113,6 +143,10 @@ async def get_port_bytes(host, password, port):
                     break
             except asyncio.TimeoutError:
                 break
+            except budget.BudgetExceeded:
+                discard_session(writer)
+                writer.close()
+                raise
 
         writer.close()
         await asyncio.sleep(0.05)
@@ -186,22 +220,43 @@ async def get_port_errors(host, password, port):
 
     return rx_crc, tx_crc
 
+DLINK_LOG_PORT = re.compile(r"\bport(?:\s+number\s*:)?\s+(\d+(?::\d+)?)\b", re.IGNORECASE)
+
+def parse_dlink_log_event(line):
+    """Строка show log -> LogEvent (первое число строки - индекс записи)"""
+    m = DLINK_LOG_PORT.search(line)
+    if not m:
+        return None
+    idx = re.match(r"(\d+)\s", line)
+    return event_from_line(line, m.group(1), int(idx.group(1)) if idx else None)
+
+# ===== WATCH =====
+# DES/DGS не выводят лог в telnet-сессию - события только через syslog
+MONITOR_COMMANDS = None
+
+parse_log_line = parse_dlink_log_event
+
 async def get_device_logs(host, password, port, max_logs=15):
+    """
+    Синхронизирует локальную копию лога и возвращает историю порта.
+    show log выводится от новых записей к старым, поэтому листание
+    прекращается на первой уже сохраненной записи.
+    """
+    device_log = get_log_store().device(host)
+
     reader, writer = await telnet_connect(host, password)
+    await pace_command(writer)
     writer.write("show log\n")
     await asyncio.sleep(0.5)
 
-    logs = []
-    port_patterns = [
-        rf"\bport\s+{port}\b",
-        rf"\bPort\s+{port}\b",
-        rf"\bPort Number\s*:\s*{port}\b"
-    ]
-    port_regex = re.compile("|".join(port_patterns), re.IGNORECASE)
+    events = []
+    reached_known = False
+    chunk = ""
 
     while True:
         try:
-            chunk = await asyncio.wait_for(reader.read(4096), timeout=5.0)
+            # done проверяется, пока chunk - еще прошлый кусок вывода
+            chunk = await budget.read(reader, 4096, 5.0, done=lambda: at_prompt(chunk))
             if not chunk:
                 break
 
@@ -211,11 +266,19 @@ async def get_device_logs(host, password, port, max_logs=15):
                     continue
                 if any(x in cleaned for x in ["CTRL+C", "ESC", "Quit", "Next Page", "SPACE", "Enter"]):
                     continue
-                if port_regex.search(cleaned):
-                    logs.append(cleaned)
+                event = parse_dlink_log_event(cleaned)
+                if event:
+                    if device_log.is_seen(event):
+                        reached_known = True
+                    else:
+                        events.append(event)
 
             more_markers = ["----", "Next Page", "Press any key", "SPACE", "CTRL+C"]
             if any(marker in chunk for marker in more_markers):
+                if reached_known:
+                    writer.write("q")
+                    await asyncio.sleep(0.2)
+                    break
                 writer.write(" ")
                 await asyncio.sleep(0.2)
                 continue
@@ -225,10 +288,37 @@ async def get_device_logs(host, password, port, max_logs=15):
 
         except asyncio.TimeoutError:
             break
+        except budget.BudgetExceeded:
+            discard_session(writer)
+            writer.close()
+            raise
 
     writer.close()
     await asyncio.sleep(0.2)
-    return logs[-max_logs:]
+
+    device_log.add(events, newest_first=True)
+    return [e.text for e in device_log.port_history(port, max_logs)]
+
+# ================== CRAWL ==================
+def parse_dlink_lldp(lines):
+    """
+    show lldp remote_ports: локальный 'Port ID' отличается от удаленного
+    тем, что за ним следует 'Remote Entities Count'.
+    """
+    marked = []
+    for i, line in enumerate(lines):
+        m = re.match(r"Port ID\s*:\s*(\S+)$", line)
+        if m and any("Remote Entities Count" in l for l in lines[i + 1:i + 4]):
+            line = f"LOCAL PORT : {m.group(1)}"
+        marked.append(line)
+    return parse_lldp_detail("\n".join(marked), re.compile(r"^LOCAL PORT : (\S+)"))
+
+async def crawl_info(host, password, mac):
+    """Запись FDB с этим MAC и соседи LLDP"""
+    lines = await get_telnet_output(host, password, f"show fdb mac_address {format_mac(mac, upper=True)}")
+    entry = next((e for e in parse_fdb(lines) if e.mac == mac), None)
+    lldp = await get_telnet_output(host, password, "show lldp remote_ports", page_all=True)
+    return entry, parse_dlink_lldp(lldp)
 
 # ================== MODEL / SERIAL ==================
 async def get_switch_model_serial(host, password, commands):
@@ -267,40 +357,73 @@ async def run(host, password, port):
         "switch": "show switch"
     }
 
-    try:
-        await get_telnet_output(host, password, commands["switch"])
-    except Exception:
-        print("\n❌ Устройство не определено как D-Link. Скрипт завершён.")
+    # ===== PORT STATUS: проверка вендора и линк - в первую очередь =====
+    link_known = False
+    with section("PORT STATUS", critical=True, report=False):
+        try:
+            await get_telnet_output(host, password, commands["switch"])
+        except budget.BudgetExceeded:
+            raise
+        except Exception:
+            print("\n❌ Устройство не определено как D-Link. Скрипт завершён.")
+            return
+        speed = await show_ports_speed(host, password, port)
+        link_known = True
+
+    if not link_known:
+        print(f"\n===== PORT STATUS =====\n{MISSING}")
         return
 
-    speed = await show_ports_speed(host, password, port)
     if not speed:
         print(f"\n===== PORT STATUS =====\n❌ Порт {port} не активен (DOWN). Проверьте кабель / питание / подключение роутера")
-        logs = await get_device_logs(host, password, port)
-        print(f"\n===== DEVICE LOGS =====")
-        for log in logs or []:
-            print(log)
-        return
+        await print_device_logs(host, password, port)
+        # счетчики CRC для DOWN не запрашиваются - в историю не попадут
+        return PortCounters(host=host, port=str(port), state="DOWN", complete=False)
 
     print(f"\n===== PORT SPEED =====\nПорт: {port}\nСостояние порта: UP\nСкорость порта: {speed}")
 
-    mac_table = await get_port_macs(host, password, port)
-    print(f"\n===== PORT MAC/VLAN =====")
-    for entry in mac_table or []:
-        print(f"MAC: {entry['mac']}\nVLAN: {entry['vid']}")
-
-    rx_bytes, tx_bytes = await get_port_bytes(host, password, port)
-    print(f"\n===== PORT TRAFFIC BYTES (Total/5sec) =====")
-    print(f"RX Bytes (5s): {rx_bytes if rx_bytes is not None else 'Не найдено'}")
-    print(f"TX Bytes (5s): {tx_bytes if tx_bytes is not None else 'Не найдено'}")
+    with section("PORT MAC/VLAN"):
+        mac_table = await get_port_macs(host, password, port)
+        history.record_macs(host, port, mac_table)
+        print(f"\n===== PORT MAC/VLAN =====")
+        for entry in mac_table or []:
+            print(f"MAC: {format_mac(entry.mac, upper=True)}\nVLAN: {entry.vlan}")
 
-    rx_crc, tx_crc = await get_port_errors(host, password, port)
-    print(f"\n===== PORT ERROR CRC =====\nCRC Error: {rx_crc} (RX)\nCRC Error: {tx_crc} (TX)")
+    # разделы, прерванные бюджетом, оставляют счетчики несобранными
+    traffic_known = errors_known = False
+    rx_bytes = tx_bytes = None
+    with section("PORT TRAFFIC BYTES"):
+        rx_bytes, tx_bytes = await get_port_bytes(host, password, port)
+        traffic_known = True
+        print(f"\n===== PORT TRAFFIC BYTES (Total/5sec) =====")
+        print(f"RX Bytes (5s): {rx_bytes if rx_bytes is not None else 'Не найдено'}")
+        print(f"TX Bytes (5s): {tx_bytes if tx_bytes is not None else 'Не найдено'}")
 
-    logs = await get_device_logs(host, password, port)
-    print(f"\n===== DEVICE LOGS =====")
-    for log in logs or []:
-        print(log)
+    rx_crc = tx_crc = 0
+    with section("PORT ERROR CRC"):
+        rx_crc, tx_crc = await get_port_errors(host, password, port)
+        errors_known = True
+        print(f"\n===== PORT ERROR CRC =====\nCRC Error: {rx_crc} (RX)\nCRC Error: {tx_crc} (TX)")
+
+    await print_device_logs(host, password, port)
+
+    return PortCounters(
+        host=host,
+        port=str(port),
+        state="UP",
+        speed=speed,
+        in_rate=(rx_bytes or 0) * 8,
+        out_rate=(tx_bytes or 0) * 8,
+        crc=rx_crc + tx_crc,
+        complete=traffic_known and errors_known
+    )
+
+async def print_device_logs(host, password, port):
+    with section("DEVICE LOGS"):
+        logs = await get_device_logs(host, password, port)
+        print(f"\n===== DEVICE LOGS =====")
+        for log in logs or []:
+            print(log)
 
 # ================== MAIN ==================
 if __name__ == "__main__":
@@ -1,5 +1,11 @@
-import asyncio, re
+import re
 from core.telnet_common import telnet_connect, send_command
+from core.records import MacEntry, PortCounters, mac_to_int, format_mac, to_int, stack_port
+from core.log_store import get_log_store, event_from_line
+from core import history
+from core.lldp import neighbor_from_detail
+from core.budget import section, MISSING
+from core.plan import Step, execute
 
 # ================== PARSERS ==================
 def parse_switch_info(output: str):
@@ -46,7 +52,14 @@ def parse_interface(output: str):
     status = status_match.group(1) if status_match else "down"
 
     if status.lower() != "up":
-        return {"status": "down"}
+        # счетчики ошибок show interfaces выводит и для неактивного порта
+        input_errors_match = re.search(r"(\d+) input errors", output)
+        output_errors_match = re.search(r"(\d+) output errors", output)
+        return {
+            "status": "down",
+            "input_errors": input_errors_match.group(1) if input_errors_match else None,
+            "output_errors": output_errors_match.group(1) if output_errors_match else None,
+        }
 
     duplex_speed_match = re.search(r"Full-duplex, (\d+Mbps), .*media type is (\S+)", output)
     link_speed = duplex_speed_match.group(1) if duplex_speed_match else "Unknown"
@@ -72,6 +85,27 @@ def parse_interface(output: str):
         "output_errors": output_errors
     }
 
+def to_port_counters(host, port, port_info):
+    if port_info["status"] != "up":
+        return PortCounters(
+            host=host,
+            port=port,
+            state="DOWN",
+            in_errors=to_int(port_info["input_errors"]),
+            out_errors=to_int(port_info["output_errors"]),
+            complete=port_info["input_errors"] is not None,
+        )
+    return PortCounters(
+        host=host,
+        port=port,
+        state="UP",
+        speed=port_info["link_speed"],
+        in_rate=to_int(port_info["input_rate"]) * 1000,
+        out_rate=to_int(port_info["output_rate"]) * 1000,
+        in_errors=to_int(port_info["input_errors"]),
+        out_errors=to_int(port_info["output_errors"])
+    )
+
 def parse_mac_table(output: str):
     mac_entries = []
     lines = output.splitlines()
@@ -80,68 +114,136 @@ def parse_mac_table(output: str):
         match = re.match(r"^(\d+)\s+([0-9a-f:]{17})\s+(\S+)\s+(\S+)", line, re.I)
         if match:
             vlan, mac, port, type_ = match.groups()
-            mac_entries.append({
-                "vlan": vlan,
-                "mac": mac,
-                "port": port,
-                "type": type_
-            })
+            mac_entries.append(MacEntry(
+                mac=mac_to_int(mac),
+                vlan=int(vlan),
+                port=port,
+                type=type_
+            ))
     return mac_entries
 
-async def get_port_logs(reader, writer, short_port, max_lines=15):
-    cmd = "show logging"
-    writer.write(cmd + "\n")
-    await asyncio.sleep(0.5)
-
-    output = ""
-    while True:
-        try:
-            chunk = await asyncio.wait_for(reader.read(4096), timeout=1.5)
-            if not chunk:
-                break
-            output += chunk
-            # постраничный вывод
-            if "More:" in chunk or "---- More ----" in chunk:
-                writer.write(" ")
-                await asyncio.sleep(0.2)
-        except asyncio.TimeoutError:
-            break
-
-    # Фильтруем в Python по порту
-    lines = []
+ELTEX_LOG_PORT = re.compile(r"\b((?:fa|gi|te)\d+/\d+/\d+)\b", re.I)
+# эхо команды (с приглашением или без): "console# show logging | include fa1/0/2"
+ELTEX_COMMAND_ECHO = re.compile(r"^(?:\S*[#>]\s*)?show\s", re.I)
+
+def parse_eltex_log_events(output: str):
+    """
+    События портов из лога. Событием считается строка со временем или
+    состоянием линка: с | include коммутатор повторяет команду, и порт
+    из фильтра иначе превращал бы эхо в запись лога.
+    """
+    events = []
     for line in output.splitlines():
         line = line.strip()
-        if re.search(rf"\b{re.escape(short_port)}\b", line, re.I):
-            lines.append(line)
-    return lines[-max_lines:]
+        if ELTEX_COMMAND_ECHO.match(line):
+            continue
+        m = ELTEX_LOG_PORT.search(line)
+        if m:
+            event = event_from_line(line, m.group(1).lower())
+            if event.timestamp or event.state:
+                events.append(event)
+    return events
+
+# ===== WATCH =====
+MONITOR_COMMANDS = ("terminal monitor",)
+
+def parse_log_line(line):
+    events = parse_eltex_log_events(line)
+    return events[0] if events else None
+
+def known_logs_reached(device_log):
+    """
+    Условие остановки листания: show logging идет от новых записей к
+    старым, дальше уже сохраненной записи листать незачем.
+    """
+    def stop(output):
+        return any(device_log.is_seen(e) for e in parse_eltex_log_events(output))
+    return stop
+
+# ===== CRAWL =====
+LLDP_TABLE_PORT = re.compile(r"^\s*((?:fa|gi|te)\d+/\d+/\d+)\s+\S+", re.I | re.M)
+
+async def crawl_info(host: str, password: str, mac: int):
+    """Запись FDB с этим MAC и соседи LLDP - за одну сессию"""
+    reader, writer = await telnet_connect(host, password)
+    try:
+        fdb = await send_command(
+            reader, writer, f"show mac address-table address {format_mac(mac, sep=':')}"
+        )
+        table = await send_command(reader, writer, "show lldp neighbors")
+        neighbors = []
+        # в таблице соседей нет адреса управления - он в подробном выводе порта
+        for port in dict.fromkeys(p.lower() for p in LLDP_TABLE_PORT.findall(table)):
+            detail = await send_command(reader, writer, f"show lldp neighbors {port}")
+            neighbors.append(neighbor_from_detail(port, detail))
+    finally:
+        writer.close()
+
+    entry = next((e for e in parse_mac_table(fdb) if e.mac == mac), None)
+    return entry, neighbors
 
 # ================== RUN ==================
+def switch_info(results):
+    return parse_switch_info(results["system"])
+
+def interface_command(results, params):
+    int_type = determine_interface_type(switch_info(results)["speed"])
+    return f"show interfaces {int_type} {params['port']}"
+
+def mac_command(results, params):
+    int_type = determine_interface_type(switch_info(results)["speed"])
+    return f"show mac address-table interface {int_type} {params['port']}"
+
+def log_port(results, params):
+    """Порт в записях лога: fa1/0/2, gi1/0/2"""
+    int_type = determine_interface_type(switch_info(results)["speed"])
+    return f"{int_type[:2].lower()}{params['port']}"
+
+def port_up(results):
+    return parse_interface(results["interface"])["status"] == "up"
+
+# план диагностики: show system одновременно подтверждает MES и дает
+# тип интерфейсов; MAC-таблица нужна только для порта в UP, лог - всегда.
+# Записи других портов отсекает сам коммутатор, если прошивка умеет include
+PLAN = (
+    Step("system", "show system", "PORT STATUS", critical=True),
+    Step("interface", interface_command, "PORT STATUS", needs=("system",), when=switch_info, critical=True),
+    Step("mac", mac_command, "PORT VLAN / MAC", needs=("interface",), when=port_up),
+    Step("logs", "show logging", "DEVICE LOGS", needs=("interface",), include=log_port),
+)
+
 async def run(host: str, password: str, port: str):
     print("➡ Running ELTEX diagnostics...")
 
     # Input PORT: 2 -> 1/0/2
-    if "/" not in port:
-        port = f"1/0/{port}"
+    port = stack_port(port)
 
-    reader, writer = await telnet_connect(host, password)
+    device_log = get_log_store().device(host)
+    # лог листаем только до уже сохраненных записей
+    stops = {"logs": known_logs_reached(device_log)}
 
+    writer = None
     try:
-        # ===== BASE COMMANDS =====
-        commands = {
-            "version": "show version",
-            "system": "show system",
-            "switch": "show switch"
-        }
+        with section("PORT STATUS", critical=True, report=False):
+            reader, writer = await telnet_connect(host, password)
+        if writer is None:
+            print(f"\n===== PORT STATUS =====\n{MISSING}")
+            return
+
+        async def fetch(command, stop):
+            return await send_command(reader, writer, command, stop=stop)
 
-        outputs = {}
-        for key, cmd in commands.items():
-            outputs[key] = await send_command(reader, writer, cmd)
+        data = await execute(PLAN, fetch, "ELTEX", params={"port": port}, stops=stops, host=host)
 
-        if not find_mes_presence(outputs):
+        if "system" not in data:
+            print(f"\n===== PORT STATUS =====\n{MISSING}")
+            return
+
+        if not find_mes_presence(data.results):
             print("❌ Устройство не является MES.")
             return 
 
-        sys_info = parse_switch_info(outputs.get("system", ""))
+        sys_info = switch_info(data.results)
         if not sys_info:
             print("⚠ Не удалось извлечь данные о коммутаторе.")
             return
@@ -158,9 +260,10 @@ async def run(host: str, password: str, port: str):
         short_port = f"{int_type[:2].lower()}{port}"
 
         # ===== INTERFACE INFO =====
-        interface_cmd = f"show interfaces {int_type} {full_port}"
-        int_output = await send_command(reader, writer, interface_cmd)
-        port_info = parse_interface(int_output)
+        if "interface" not in data:
+            print(f"\n===== PORT STATUS =====\n{MISSING}")
+            return
+        port_info = parse_interface(data["interface"])
 
         # ===== BASIC INFO =====
         print("\n===== INFO =====")
@@ -188,19 +291,20 @@ async def run(host: str, password: str, port: str):
             print(f"Output errors : {port_info['output_errors']}")
 
             # ===== MAC TABLE =====
-            mac_cmd = f"show mac address-table interface {int_type} {full_port}"
-            mac_output = await send_command(reader, writer, mac_cmd)
-            mac_entries = parse_mac_table(mac_output)
-
             print("\n===== PORT VLAN / MAC =====")
-            if mac_entries:
-                for entry in mac_entries:
-                    print(f"VLAN: {entry['vlan']}")
-                    print(f"MAC : {entry['mac']}")
-                    print(f"Type: {entry['type']}")
-                    print("-" * 25)
+            if "mac" in data:
+                mac_entries = parse_mac_table(data["mac"])
+                history.record_macs(host, full_port, mac_entries)
+                if mac_entries:
+                    for entry in mac_entries:
+                        print(f"VLAN: {entry.vlan}")
+                        print(f"MAC : {format_mac(entry.mac, sep=':')}")
+                        print(f"Type: {entry.type}")
+                        print("-" * 25)
+                else:
+                    print("⚠ MAC-адреса на порту не найдены.")
             else:
-                print("⚠ MAC-адреса на порту не найдены.")
+                print(MISSING)
 
         # ===== DOWN STATE =====
         else:
@@ -212,14 +316,21 @@ async def run(host: str, password: str, port: str):
             print("  - Проверьте удалённую сторону")
 
         # ===== LOGS (ALWAYS) =====
-        port_logs = await get_port_logs(reader, writer, short_port, max_lines=15)
-
         print("\n===== DEVICE LOGS =====")
-        if port_logs:
-            for line in port_logs:
-                print(line)
+        if "logs" in data:
+            device_log.add(parse_eltex_log_events(data["logs"]), newest_first=True)
+            port_logs = [e.text for e in device_log.port_history(short_port, 15)]
+            if port_logs:
+                for line in port_logs:
+                    print(line)
+            else:
+                print("⚠ Логи для порта не найдены.")
         else:
-            print("⚠ Логи для порта не найдены.")
+            print(MISSING)
+
+        print("\n" + data.summary())
+        return to_port_counters(host, full_port, port_info)
 
     finally:
-        writer.close()
+        if writer is not None:
+            writer.close()
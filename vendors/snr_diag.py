@@ -2,6 +2,12 @@ import asyncio
 import telnetlib3
 import re
 from core.telnet_common import telnet_connect, send_command
+from core.records import MacEntry, LogEvent, PortCounters, mac_to_int, format_mac, to_int, stack_port
+from core.log_store import get_log_store, event_from_line
+from core import history
+from core.lldp import parse_lldp_detail
+from core.budget import section, MISSING
+from core.plan import Step, execute
 
 # ================== PARSERS ==================
 def extract(regex, text, default="N/A"):
@@ -31,6 +37,19 @@ def parse_snr_interface(raw):
 
     return data
 
+def to_port_counters(host, port, iface):
+    return PortCounters(
+        host=host,
+        port=port,
+        state=iface["state"],
+        speed=iface["speed"],
+        in_rate=iface["in_5s"],
+        out_rate=iface["out_5s"],
+        in_errors=to_int(iface["input_err"]),
+        out_errors=to_int(iface["output_err"]),
+        crc=to_int(iface["crc"])
+    )
+
 def parse_snr_mac(raw: str):
     for line in raw.splitlines():
         cols = line.split()
@@ -45,38 +64,102 @@ def parse_snr_mac(raw: str):
             continue
 
         if len(cols) >= 2 and "-" in cols[1] and ":" not in cols[1]:
-            return {"vlan": cols[0], "mac": cols[1]}
+            try:
+                return MacEntry(
+                    mac=mac_to_int(cols[1]),
+                    vlan=int(cols[0]),
+                    port=cols[-1] if len(cols) > 2 else ""
+                )
+            except ValueError:
+                continue
 
     return None
 
-def parse_snr_logs(raw, port, limit=15):
-    logs_short = []
-    port_digits = re.escape(str(port))
+SNR_LOG = re.compile(
+    r"(\d+)\s+(%[A-Za-z]+\s+\d+\s+\d+:\d+:\d+).*?Ethernet(\d+(?:/\d+)*).*?(UP|DOWN)",
+    re.IGNORECASE
+)
 
-    pattern = re.compile(
-        rf"(\d+)\s+(%[A-Za-z]+\s+\d+\s+\d+:\d+:\d+).*?Ethernet{port_digits}.*?(UP|DOWN)",
-        re.IGNORECASE
-    )
+def parse_snr_log_events(raw, port=None, limit=None):
+    """События UP/DOWN; port=None - по всем портам"""
+    events = []
 
     for line in raw.splitlines():
-        match = pattern.search(line)
-        if match:
-            log_id = match.group(1)
-            dt = match.group(2)
-            state = match.group(3).upper()
-            logs_short.append(f"{log_id} {dt} - {state}")
-
-        if len(logs_short) >= limit:
+        match = SNR_LOG.search(line)
+        if match and (port is None or match.group(3) == str(port)):
+            events.append(LogEvent(
+                log_id=int(match.group(1)),
+                timestamp=match.group(2),
+                port=match.group(3),
+                state=match.group(4).upper(),
+                text=line.strip()
+            ))
+
+        if limit and len(events) >= limit:
             break
 
-    return logs_short
+    return events
+
+SNR_LINK = re.compile(r"Ethernet(\d+(?:/\d+)*).*?\b(UP|DOWN)\b", re.IGNORECASE)
+
+# ===== WATCH =====
+MONITOR_COMMANDS = ("terminal monitor",)
+
+def parse_log_line(line):
+    """Строка из terminal monitor / syslog -> LogEvent или None"""
+    events = parse_snr_log_events(line)
+    if events:
+        return events[0]
+    match = SNR_LINK.search(line)
+    if match:
+        return event_from_line(line, match.group(1))
+    return None
+
+def format_log_event(event):
+    return f"{event.log_id} {event.timestamp} - {event.state}"
+
+def parse_snr_logs(raw, port, limit=15):
+    return [format_log_event(e) for e in parse_snr_log_events(raw, port, limit)]
+
+def is_newest_first(events):
+    return len(events) >= 2 and events[0].log_id > events[1].log_id
+
+def known_logs_reached(device_log):
+    """
+    Условие остановки листания: лог идет от новых к старым и дошел до уже
+    сохраненной записи. Проверяется сама запись, а не максимальный id:
+    при фильтре по порту в локальном логе есть записи не всех портов.
+    """
+    def stop(output):
+        events = parse_snr_log_events(output)
+        return is_newest_first(events) and device_log.is_seen(events[-1])
+    return stop
 
 def parse_snr_model(raw):
     match = re.search(r"SNR-[\w]+", raw)
     return match.group(0) if match else "N/A"
 
+# ===== CRAWL =====
+LLDP_LOCAL_PORT = re.compile(r"(?:Port\s*name|Interface)\s*:\s*(?:Ethernet)?(\d+(?:/\d+)+)", re.I)
+
+async def crawl_info(host: str, password: str, mac: int):
+    """Запись FDB с этим MAC и соседи LLDP - за одну сессию"""
+    reader, writer = await telnet_connect(host, password)
+    try:
+        fdb = await send_command(
+            reader, writer, f"show mac-address-table address {format_mac(mac)}"
+        )
+        lldp = await send_command(reader, writer, "show lldp neighbors")
+    finally:
+        writer.close()
+
+    entry = parse_snr_mac(fdb)
+    if entry and entry.mac != mac:
+        entry = None
+    return entry, parse_lldp_detail(lldp, LLDP_LOCAL_PORT)
+
 # ================== OUTPUT ==================
-def print_report(port, iface, mac, logs_short, base_info):
+def print_report(port, iface, mac, logs_short, base_info, missing=()):
     print(f'\n------------ [PORT {port}] ------------')
     print("\n===== DEVICE INFO =====")
     print(f"MODEL   : {base_info['model']}")
@@ -92,9 +175,11 @@ def print_report(port, iface, mac, logs_short, base_info):
     else:
         print(f"SPEED : {iface['speed']}")
         print(f"\n===== PORT MAC/VLAN =====")
-        if mac:
-            print(f"MAC  : {mac['mac']}")
-            print(f"VLAN : {mac['vlan']}")
+        if "PORT MAC/VLAN" in missing:
+            print(MISSING)
+        elif mac:
+            print(f"MAC  : {format_mac(mac.mac)}")
+            print(f"VLAN : {mac.vlan}")
         else:
             print("MAC не найден")
 
@@ -111,6 +196,8 @@ def print_report(port, iface, mac, logs_short, base_info):
 
     # Логи выводим всегда
     print("\n===== DEVICE LOGS =====")
+    if "DEVICE LOGS" in missing:
+        print(MISSING, "- показан локальный лог")
     if logs_short:
         for l in logs_short:
             print(l)
@@ -118,50 +205,67 @@ def print_report(port, iface, mac, logs_short, base_info):
         print("Логи не найдены")
 
 # ================== RUN ==================
+def is_snr(results):
+    return parse_snr_model(results["version"]).startswith("SNR-")
+
+def port_up(results):
+    return parse_snr_interface(results["iface"])["state"] != "DOWN"
+
+# план диагностики: модель проверяется до команд по порту,
+# MAC-таблица нужна только для порта в UP
+PLAN = (
+    Step("version", "show version", "LINK", critical=True),
+    Step("iface", "show interface ethernet {port}", "LINK", needs=("version",), when=is_snr, critical=True),
+    Step("mac", "show mac-address-table interface ethernet {port}", "PORT MAC/VLAN", needs=("iface",), when=port_up),
+    Step("logs", "show logging flash", "DEVICE LOGS", needs=("iface",), include="Ethernet{port}"),
+)
+
 async def run(host: str, password: str, port: str):
     # Добавляем префикс для порта, если нужно
-    if "/" not in port:
-        port = f"1/0/{port}"
+    port = stack_port(port)
 
-    reader, writer = await telnet_connect(host, password)
+    device_log = get_log_store().device(host)
+    # лог листаем только до уже сохраненных записей
+    stops = {"logs": known_logs_reached(device_log)}
 
-    # ===== PORT COMMANDS =====
-    port_commands = {
-        "iface": f"show interface ethernet {port}",
-        "mac": f"show mac-address-table interface ethernet {port}",
-        "logs": "show logging flash"
-    }
-
-    # ===== BASE COMMANDS =====
-    base_commands = {
-        "version": "show version",
-        "system": "show system",
-        "switch": "show switch"
-    }
+    writer = None
+    try:
+        with section("LINK", critical=True, report=False):
+            reader, writer = await telnet_connect(host, password)
+        if writer is None:
+            print(f"\n===== LINK =====\n{MISSING}")
+            return
 
-    data = {}
-    for key, cmd in port_commands.items():
-        data[key] = await send_command(reader, writer, cmd)
+        async def fetch(command, stop):
+            return await send_command(reader, writer, command, stop=stop)
 
-    for key, cmd in base_commands.items():
-        data[key] = await send_command(reader, writer, cmd)
+        data = await execute(PLAN, fetch, "SNR", params={"port": port}, stops=stops, host=host)
+    finally:
+        if writer is not None:
+            writer.close()
 
-    # Парсим модель
-    model = parse_snr_model(data["version"])
-    if not model.startswith("SNR-"):
+    if "version" in data and not is_snr(data.results):
         print(f"\nУстройство {host} не является оборудованием SNR. Диагностика пропущена.")
-        writer.close()
+        return
+    if "iface" not in data:
+        print(f"\n===== LINK =====\n{MISSING}")
         return
 
     # Продолжаем диагностику
     iface = parse_snr_interface(data["iface"])
-    mac = parse_snr_mac(data["mac"])
-    logs_short = parse_snr_logs(data["logs"], port)
+    mac = parse_snr_mac(data.get("mac"))
+    if "mac" in data:
+        history.record_macs(host, port, [mac] if mac else [])
+    events = parse_snr_log_events(data.get("logs"))
+    device_log.add(events, newest_first=is_newest_first(events))
+    logs_short = [format_log_event(e) for e in device_log.port_history(port)]
 
     base_info = {
-        "model": model,
+        "model": parse_snr_model(data["version"]),
         "version": extract(r"SoftWare Version ([\d\.]+)", data["version"], "N/A")
     }
 
-    print_report(port, iface, mac, logs_short, base_info)
-    writer.close()
+    missing = [step.section for step in PLAN if step.key in data.missed]
+    print_report(port, iface, mac, logs_short, base_info, missing)
+    print("\n" + data.summary())
+    return to_port_counters(host, port, iface)
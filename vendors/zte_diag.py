@@ -2,6 +2,12 @@ import asyncio
 import telnetlib3
 import re
 from core.telnet_common import telnet_connect, send_command
+from core.records import MacEntry, MacTable, PortCounters, mac_to_int, format_mac, to_int, speed_to_bps
+from core.log_store import get_log_store, event_from_line, newest_first
+from core import history
+from core.lldp import parse_lldp_detail
+from core.budget import section, MISSING
+from core.plan import Step, execute
 
 # ================== PARSERS ==================
 def extract(regex, text, default='N/A'):
@@ -27,99 +33,213 @@ def is_zte(outputs: dict):
     version_output = outputs.get("version", "")
     return "ZXR10" in version_output
 
-def parse_zte_mac(raw: str):
-    table = []
+def iter_zte_mac(raw: str):
     for line in raw.splitlines():
         cols = line.split()
         if not cols or 'MAC' in line.upper() or 'VLAN' in line.upper():
             continue
-        if len(cols) >= 4:
-            table.append({
-                'mac': cols[0],
-                'vlan': cols[1],
-                'port': cols[2],
-                'time': cols[11] if len(cols) > 11 else ''
-            })
-    return table
+        if len(cols) >= 4 and cols[1].isdigit():
+            try:
+                mac = mac_to_int(cols[0])
+            except ValueError:
+                continue
+            yield MacEntry(
+                mac=mac,
+                vlan=int(cols[1]),
+                port=cols[2],
+                time=cols[11] if len(cols) > 11 else ''
+            )
+
+def parse_zte_mac(raw: str):
+    return list(iter_zte_mac(raw))
+
+def parse_dhcp_binding(raw: str, port: str):
+    """Строка привязки DHCP relay для порта -> (MAC, IP, VLAN)"""
+    for line in raw.splitlines():
+        cols = line.split()
+        if len(cols) >= 6 and cols[4] == port:
+            return cols[0], cols[1], cols[3]
+    return None, None, None
+
+def find_real_port(results, port: str):
+    """Порт, где в MAC-таблице виден клиент из привязки DHCP"""
+    dhcp_mac = parse_dhcp_binding(results.get('dhcp', ''), port)[0]
+    if not dhcp_mac:
+        return port
+    try:
+        dhcp_mac_int = mac_to_int(dhcp_mac)
+    except ValueError:
+        return port
+    mac_entry = next((m for m in parse_zte_mac(results.get('mac_dynamic', '')) if m.mac == dhcp_mac_int), None)
+    if mac_entry:
+        return re.findall(r'\d+', mac_entry.port)[-1]
+    return port
+
+# ===== ФИЛЬТРЫ НА КОММУТАТОРЕ =====
+def port_column(port: str) -> str:
+    """
+    Образец | include для столбца порта: номер между не-цифрами (и не '.'/':',
+    чтобы не совпадать с IP и MAC). Голый номер нашелся бы почти в каждой
+    строке таблицы - в адресах, VLAN, времени аренды.
+    """
+    return f'[^0-9.:]{port}[^0-9.:]'
+
+def port_interface(results, port: str):
+    """Имя интерфейса порта, как его печатает коммутатор (fei_1/6), по MAC-таблице порта"""
+    for entry in parse_zte_mac(results.get('mac_dynamic', '')):
+        if not entry.port.isdigit() and re.findall(r'\d+', entry.port)[-1:] == [port]:
+            return entry.port
+    return None
+
+def mac_protect_filter(results, params):
+    real_port = find_real_port(results, params['port'])
+    return port_interface(results, real_port) or port_column(real_port)
+
+ZTE_LOG_PORT = re.compile(r'Port\s*:\s*(\d+)\b')
+
+def parse_zte_log_events(raw: str):
+    events = []
+    for line in raw.splitlines():
+        m = ZTE_LOG_PORT.search(line)
+        if m:
+            events.append(event_from_line(line, m.group(1)))
+    return events
+
+def known_logs_reached(device_log):
+    """
+    Условие остановки листания лога: записи идут от новых к старым (номеров
+    у записей нет - порядок по времени) и страница дошла до уже сохраненной.
+    """
+    def stop(output):
+        events = parse_zte_log_events(output)
+        return newest_first(events) and device_log.is_seen(events[-1])
+    return stop
+
+# ===== WATCH =====
+MONITOR_COMMANDS = ("terminal monitor",)
+
+def parse_log_line(line):
+    events = parse_zte_log_events(line)
+    return events[0] if events else None
+
+# ===== CRAWL =====
+LLDP_LOCAL_PORT = re.compile(r'Local\s*Port(?:\s*ID)?\s*:\s*(\S+)', re.I)
+
+async def crawl_info(host: str, password: str, mac: int):
+    """Запись FDB с этим MAC и соседи LLDP - за одну сессию"""
+    reader, writer = await telnet_connect(host, password)
+    try:
+        fdb = await send_command(reader, writer, 'show mac dynamic')
+        lldp = await send_command(reader, writer, 'show lldp entry')
+    finally:
+        writer.close()
+
+    # FDB всего коммутатора - колоночной таблицей, без списка MacEntry
+    entry = MacTable(iter_zte_mac(fdb)).find(mac)
+    return entry, parse_lldp_detail(lldp, LLDP_LOCAL_PORT)
 
 # ================== RUN ==================
+def port_state(results):
+    return extract(r'\b(UP|DOWN)\b', results['port']).upper()
+
+def port_up(results):
+    return port_state(results) != 'DOWN'
+
+# план диагностики: сначала вендор и линк, остальное - только для UP
+PLAN = (
+    Step('version', 'show version', 'LINK', critical=True),
+    Step('port', 'show port {port}', 'LINK', needs=('version',), when=is_zte, critical=True),
+    Step('mac_dynamic', 'show mac dynamic port {port}', 'MAC TABLE', needs=('port',), when=port_up),
+    Step('statistics', 'show port {port} statistics', 'PORT ERRORS', needs=('port',), when=port_up),
+    Step('utilization', 'show port {port} utilization', 'PORT TRAFFIC', needs=('port',), when=port_up),
+    # таблицы всего коммутатора фильтруются на нем самом, если прошивка умеет
+    Step('dhcp', 'show dhcp relay binding', 'DHCP', needs=('port',), when=port_up,
+         include=lambda results, params: port_column(params['port'])),
+    Step('mac_protect', 'show mac protect', 'MAC PROTECT', needs=('port',), when=port_up,
+         include=mac_protect_filter),
+    Step('logs', 'show terminal log include Port', 'DEVICE LOGS', needs=('port',)),
+)
+
 async def run(host: str, password: str, port: str):
     print("➡ ZTE detected. Running ZTE diagnostics...")
-    reader, writer = await telnet_connect(host, password)
+    device_log = get_log_store().device(host)
+    # лог листаем только до уже сохраненных записей
+    stops = {'logs': known_logs_reached(device_log)}
 
-    # ===== BASE COMMANDS =====
-    commands = {
-        "version": "show version",
-        "system": "show system",
-        "switch": "show switch"
-    }
+    writer = None
+    try:
+        with section('LINK', critical=True, report=False):
+            reader, writer = await telnet_connect(host, password)
+        if writer is None:
+            print(f"\n===== LINK =====\n{MISSING}")
+            return
+
+        async def fetch(command, stop):
+            return await send_command(reader, writer, command, stop=stop)
 
-    outputs = {}
-    for key, cmd in commands.items():
-        outputs[key] = await send_command(reader, writer, cmd)
+        data = await execute(PLAN, fetch, 'ZTE', params={'port': port}, stops=stops, host=host)
+    finally:
+        if writer is not None:
+            writer.close()
 
-    if not is_zte(outputs):
+    if 'version' in data and not is_zte(data.results):
         print("❌ Данное оборудование не является ZTE.")
-        writer.close()
         return
+    if 'port' not in data:
+        print(f"\n===== LINK =====\n{MISSING}")
+        return
+
+    counters = report(host, port, data)
+    print('\n' + data.summary())
+    return counters
 
-    info = parse_zte_switch_info(outputs["version"])
+def report(host, port, data):
+    """Отчет по собранным выводам; отсутствующие разделы помечаются"""
+    info = parse_zte_switch_info(data['version'])
     print("\n===== DEVICE INFO =====")
     print("Vendor:", info["vendor"])
     print("Model:", info["model"])
     print("Ports:", info["ports"])
     print("Speed:", info["speed"])
 
-    # ===== ZTE SPECIFIC COMMANDS =====
-    cmds = {
-        'port': f'show port {port}',
-        'mac_dynamic': f'show mac dynamic port {port}',
-        'statistics': f'show port {port} statistics',
-        'utilization': f'show port {port} utilization',
-        'mac_protect': 'show mac protect',
-        'dhcp': 'show dhcp relay binding',
-        'logs': 'show terminal log include Port'
-    }
-
-    data = {}
-    for key, cmd in cmds.items():
-        data[key] = await send_command(reader, writer, cmd)
-
     # --- show port ---
     state = extract(r'\b(UP|DOWN)\b', data['port'])
     speed = extract(r'(\d+(?:\.\d+)?\s*[MG]bps?)', data['port'])
-    port_down = state.upper() == 'DOWN'
 
     # --- DHCP ---
-    dhcp_mac = dhcp_ip = dhcp_vlan = None
-    for line in data['dhcp'].splitlines():
-        cols = line.split()
-        if len(cols) >= 6 and cols[4] == port:
-            dhcp_mac = cols[0]
-            dhcp_ip = cols[1]
-            dhcp_vlan = cols[3]
-            break
+    dhcp_mac, dhcp_ip, dhcp_vlan = parse_dhcp_binding(data.get('dhcp', ''), port)
 
     # --- MAC таблица ---
-    mac_table = parse_zte_mac(data['mac_dynamic'])
-    real_port = port
-
-    if dhcp_mac:
-        mac_entry = next((m for m in mac_table if m['mac'].lower() == dhcp_mac.lower()), None)
-        if mac_entry:
-            real_port = re.findall(r'\d+', mac_entry['port'])[-1]
+    mac_table = parse_zte_mac(data.get('mac_dynamic', ''))
+    if 'mac_dynamic' in data:
+        history.record_macs(host, port, mac_table)
+    real_port = find_real_port(data, port)
 
     # --- statistics ---
-    in_err = extract(r'InMACRcvErr\s*:\s*(\d+)', data['statistics'], '0')
-    crc = extract(r'CrcError\s*:\s*(\d+)', data['statistics'], '0')
+    in_err = extract(r'InMACRcvErr\s*:\s*(\d+)', data.get('statistics', ''), '0')
+    crc = extract(r'CrcError\s*:\s*(\d+)', data.get('statistics', ''), '0')
 
     # --- utilization ---
-    util = re.search(r'input\s*[:]*\s*([\d.,]+)%\s*,\s*output\s*[:]*\s*([\d.,]+)%', data['utilization'], re.I)
+    util = re.search(r'input\s*[:]*\s*([\d.,]+)%\s*,\s*output\s*[:]*\s*([\d.,]+)%', data.get('utilization', ''), re.I)
     input_val = output_val = '0.00%'
     if util:
         input_val = f"{float(util.group(1).replace(',', '.')):.2f}%"
         output_val = f"{float(util.group(2).replace(',', '.')):.2f}%"
 
+    bps = speed_to_bps(speed)
+    counters = PortCounters(
+        host=host,
+        port=port,
+        state=state.upper(),
+        speed=speed,
+        in_rate=int(bps * float(input_val.rstrip('%')) / 100),
+        out_rate=int(bps * float(output_val.rstrip('%')) / 100),
+        in_errors=to_int(in_err),
+        crc=to_int(crc),
+        # statistics/utilization не выполняются для DOWN и могут не успеть по бюджету
+        complete='statistics' in data and 'utilization' in data
+    )
+
     # ================== OUTPUT ==================
     print(f'\n------------ [PORT {port}] ------------')
     state = state.upper()
@@ -130,7 +250,9 @@ async def run(host: str, password: str, port: str):
         print('STATE:', state)
         print('SPEED:', speed)
 
-        if dhcp_mac:
+        if 'dhcp' not in data:
+            print(f'\n===== DHCP =====\n{MISSING}')
+        elif dhcp_mac:
             print('\n===== DHCP =====')
             print('MAC:', dhcp_mac)
             print('IP:', dhcp_ip)
@@ -140,22 +262,32 @@ async def run(host: str, password: str, port: str):
             print('\nDHCP данных нет')
 
         print('\n===== MAC TABLE =====')
-        if mac_table:
+        if 'mac_dynamic' not in data:
+            print(MISSING)
+        elif mac_table:
             last = mac_table[-1]
-            print('MAC:', last['mac'])
-            print('TIME:', last['time'])
+            print('MAC:', format_mac(last.mac, sep='.', group=4))
+            print('TIME:', last.time)
         else:
             print('Нет MAC записей')
 
         print("\n===== PORT TRAFFIC =====")
-        print(f'Input: {input_val}\nOutput: {output_val}')
+        if 'utilization' in data:
+            print(f'Input: {input_val}\nOutput: {output_val}')
+        else:
+            print(MISSING)
 
         print('\n===== PORT ERRORS =====')
-        print('InMACRcvErr:', in_err)
-        print('CrcError:', crc)
+        if 'statistics' in data:
+            print('InMACRcvErr:', in_err)
+            print('CrcError:', crc)
+        else:
+            print(MISSING)
 
         print('\n===== MAC PROTECT =====')
-        for line in data['mac_protect'].splitlines():
+        if 'mac_protect' not in data:
+            print(MISSING)
+        for line in data.get('mac_protect', '').splitlines():
             cols = line.split()
             if cols and real_port in cols[0]:
                 status = cols[2] if len(cols) > 2 else 'N/A'
@@ -173,9 +305,14 @@ async def run(host: str, password: str, port: str):
 
     # ===== DEVICE LOGS =====
     print('\n===== DEVICE LOGS =====')
-    pattern = re.compile(rf'Port\s*:\s*{re.escape(real_port)}\b')
     MAX_LOG_LINES = 15
-    logs = [l for l in data['logs'].splitlines() if pattern.search(l)][:MAX_LOG_LINES]
+    device_log = get_log_store().device(host)
+    if 'logs' in data:
+        events = parse_zte_log_events(data['logs'])
+        device_log.add(events, newest_first=newest_first(events))
+    else:
+        print(MISSING, '- показан локальный лог')
+    logs = [e.text for e in device_log.port_history(real_port, MAX_LOG_LINES)]
 
     if logs:
         for log in logs:
@@ -183,4 +320,4 @@ async def run(host: str, password: str, port: str):
     else:
         print("⚠ Логи для порта не найдены.")
 
-    writer.close()
+    return counters